@@ -197,7 +197,7 @@ for case_id in range(0, Ab.args.iterations):
 
             if Ab.args.monte_carlo_iter > 0:
                 if len(args.x_init) == Ab.model.n:
-                    s_init = state2region(args.x_init, Ab.spec.partition, Ab.partition['R']['c_tuple'])
+                    s_init = state2region(args.x_init, Ab.spec.partition)
 
                     Ab.mc = MonteCarloSim(Ab, iterations=Ab.args.monte_carlo_iter,
                                         writer=writer, init_states = s_init)
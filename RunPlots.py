@@ -28,7 +28,7 @@ def plot(path):
     heatmap_3D_view(data['model'], data['setup'], data['spec'], data['regions']['center'], data['results'])
 
     from plotting.createPlots import heatmap_2D
-    heatmap_2D(data['args'], data['model'], data['setup'], data['regions']['c_tuple'], data['spec'], data['results']['optimal_reward'])
+    heatmap_2D(data['args'], data['model'], data['setup'], data['spec'], data['results']['optimal_reward'])
 
     from plotting.uav_plots import UAV_plot_2D, UAV_3D_plotLayout
     from core.define_partition import state2region
@@ -38,7 +38,7 @@ def plot(path):
     if data['model'].name in ['shuttle', 'spacecraft_2D'] :
 
         if len(data['args'].x_init) == data['model'].n:
-            s_init = state2region(data['args'].x_init, data['spec'].partition, data['regions']['c_tuple'])[0]
+            s_init = state2region(data['args'].x_init, data['spec'].partition)[0]
             traces = data['mc'].traces[s_init]
 
             UAV_plot_2D((0,1), data['setup'], data['args'], data['regions'], data['goal_regions'], data['critical_regions'], 
@@ -51,7 +51,7 @@ def plot(path):
     if data['model'].name == 'UAV' and data['model'].modelDim == 3:
 
         if len(data['args'].x_init) == data['model'].n:
-            s_init = state2region(data['args'].x_init, data['spec'].partition, data['regions']['c_tuple'])[0]
+            s_init = state2region(data['args'].x_init, data['spec'].partition)[0]
             traces = data['mc'].traces[s_init]
 
             UAV_3D_plotLayout(data['setup'], data['args'], data['model'], data['regions'], 
@@ -68,7 +68,7 @@ def plot(path):
         
         
         if len(data['args'].x_init) == data['model'].n:
-            s_init = state2region(data['args'].x_init, data['spec'].partition, data['regions']['c_tuple'])[0]
+            s_init = state2region(data['args'].x_init, data['spec'].partition)[0]
             traces = data['mc'].traces[s_init]
             
             UAV_plot_2D((0,1), data['setup'], data['args'], data['regions'], data['goal_regions'], data['critical_regions'], 
@@ -113,7 +113,7 @@ def plot(path):
     if data['model'].name in ['spacecraft_1D'] :
 
         if len(data['args'].x_init) == data['model'].n:
-            s_init = state2region(data['args'].x_init, data['spec'].partition, data['regions']['c_tuple'])[0]
+            s_init = state2region(data['args'].x_init, data['spec'].partition)[0]
             traces = data['mc'].traces[s_init]
 
             UAV_plot_2D((0,1), data['setup'], data['args'], data['regions'], data['goal_regions'], data['critical_regions'], 
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np              # Import Numpy for computations
+import io                       # Import to parse strings as files
+import functools                # Import to create partial functions
 import itertools                # Import to crate iterators
 import sys                      # Allows to terminate the code at some point
 import pandas as pd             # Import Pandas to store data in frames
@@ -13,9 +15,9 @@ from progressbar import progressbar # Import to create progress bars
 from .define_model import find_connected_components
 from .define_partition import define_partition, define_spec_region, \
     partition_plot, state2region
-from .commons import tocDiff, printWarning
+from .commons import tocDiff, printWarning, bit_table
 from .create_iMDP import mdp
-from .action_classes import action
+from .action_classes import action, enabled_actions
 
 '''
 ------------------------------------------------------------------------------
@@ -63,6 +65,17 @@ class Abstraction(object):
         else:
             print(' --- Model is fully actuated')
             self.flags['underactuated'] = False
+            
+        # Cache of the factors of noise covariance matrices
+        self._noise_cache = {}
+        
+        # Random generator (PCG64) for the noise samples. Without an explicit
+        # seed, it is seeded from the global Numpy RNG, such that seeding 
+        # the latter keeps results reproducible.
+        seed = self.setup.sampling.get('seed')
+        if seed is None:
+            seed = np.random.randint(0, 2**31 - 1)
+        self._rng = np.random.default_rng(seed)
 
         self.time['0_init'] = tocDiff(False)
         print('Abstraction object initialized - time:',self.time['0_init'])
@@ -104,11 +117,14 @@ class Abstraction(object):
 
         print(' -- Number of regions:',self.partition['nr_regions'])
 
+        # Pack the goal and critical sets into numeric arrays of boxes
+        self.spec.set_boxes()
+        
         # Determine goal regions
         self.partition['goal'], self.partition['goal_slices'], \
-            self.partition['goal_idx'] = define_spec_region(
-                allCenters = self.partition['R']['c_tuple'], 
-                sets = self.spec.goal,
+            self.partition['goal_idx'], self.partition['goal_mask'] = \
+            define_spec_region(
+                sets = self.spec.goal_box,
                 partition = self.spec.partition,
                 borderOutside = True)
         
@@ -116,9 +132,9 @@ class Abstraction(object):
 
         # Determine critical regions
         self.partition['critical'], self.partition['critical_slices'], \
-            self.partition['critical_idx'] = define_spec_region(
-                allCenters = self.partition['R']['c_tuple'], 
-                sets = self.spec.critical,
+            self.partition['critical_idx'], self.partition['critical_mask'] = \
+            define_spec_region(
+                sets = self.spec.critical_box,
                 partition = self.spec.partition,
                 borderOutside = True)
         
@@ -129,19 +145,33 @@ class Abstraction(object):
 
         # Create all combinations of n bits, to reflect combinations of all 
         # lower/upper bounds of partitions
-        bitCombinations = list(itertools.product([0, 1], 
-                               repeat=self.model.n))
-        bitRelation     = ['low','upp']
+        bitCombinations = bit_table(self.model.n)
         
         # Calculate all corner points of every partition. Every partition has 
         # an upper and lower bounnd in every state (dimension). Hence, the 
         # every partition has 2^n corners, with n the number of states.
-        self.partition['allCorners'] = np.array( [[[
-            self.partition['R'][bitRelation[bit]][i][bitIndex] 
-                for bitIndex,bit in enumerate(bitList)
-            ] for bitList in bitCombinations 
-            ] for i in range(self.partition['nr_regions'])
-            ] )
+        # Shape is (nr_regions, 2^n, n), where a bit of 1 selects the upper 
+        # bound in that dimension.
+        self.partition['allCorners'] = np.where(bitCombinations[None, :, :],
+                                   self.partition['R']['upp'][:, None, :],
+                                   self.partition['R']['low'][:, None, :])
+        
+        # Nodes of the rectangular grid (i.e. the unique corners of all 
+        # regions), in lexicographic order
+        nodes_per_dim = self.spec.partition['number'] + 1
+        self.partition['gridNodes'] = np.array(np.meshgrid(
+            *[np.linspace(b0, b1, nb) for (b0, b1), nb in 
+              zip(self.spec.partition['boundary'], nodes_per_dim)], 
+            indexing='ij')).reshape(self.model.n, -1).T
+        
+        # Index of the grid node at every corner of every region, with shape
+        # (nr_regions, 2^n)
+        region_idx = np.array(np.unravel_index(
+            np.arange(self.partition['nr_regions']), 
+            self.spec.partition['number'])).T
+        self.partition['region_nodes'] = np.ravel_multi_index(
+            np.moveaxis(region_idx[:, None, :] + bitCombinations[None, :, :], 
+                        -1, 0), nodes_per_dim)
 
 
 
@@ -168,7 +198,6 @@ class Abstraction(object):
         
         self.actions = {'obj': {},
                         'backreach_obj': {},
-                        'tup2idx': {},
                         'extra_act': []} 
 
         print('\nDefining backward reachable sets...')
@@ -184,32 +213,37 @@ class Abstraction(object):
         if type(self.spec.targets['number']) == str:
             # Set default target points to the center of every region
             
-            for center, (tup,idx) in zip(self.partition['R']['center'],
-                                        self.partition['R']['idx'].items()):
+            self.actions['number'] = self.spec.partition['number']
+            
+            for idx, tup in enumerate(np.ndindex(*self.actions['number'])):
                 
+                center = self.partition['R']['center'][idx]
                 self.actions['obj'][idx] = action(idx, self.model, center, tup, 
                                                   backreach_obj)
-                self.actions['tup2idx'][tup] = idx
             
         else:  
             
             print(' -- Compute manual target points; no. per dim:',self.spec.targets['number'])
+            
+            self.actions['number'] = self.spec.targets['number']
         
             ranges = map(np.linspace, self.spec.targets['boundary'][:,0],
                          self.spec.targets['boundary'][:,1], self.spec.targets['number'])
             
-            tuples = map(np.arange, np.zeros(self.model.n),
-                         self.spec.targets['number'])
-            
             for idx,(center,tup) in enumerate(zip(itertools.product(*ranges),
-                                                itertools.product(*tuples))):
+                                    np.ndindex(*self.actions['number']))):
                 
                 self.actions['obj'][idx] = action(idx, self.model, 
                                                   np.array(center), tup, 
                                                   backreach_obj)
-                self.actions['tup2idx'][tup] = idx
+        
+        # Default actions are enumerated in row-major order of their index 
+        # tuple, so the index of an action follows in closed form
+        self.actions['tup2idx'] = functools.partial(np.ravel_multi_index, 
+                                            dims=self.actions['number'])
         
         nr_default_act = len(self.actions['obj'])
+        self.actions['nr_default_act'] = nr_default_act
         
         # Add additional target points if this is requested
         if 'extra' in self.spec.targets:
@@ -258,6 +292,9 @@ class Abstraction(object):
                                              enabled_inv, error)
 
         self.set_extra_actions()
+        
+        # Compress the enabled actions of all states
+        self.actions['enabled'].compress()
             
         ### PLOT ###
         if self.args.partition_plot:
@@ -279,7 +316,7 @@ class Abstraction(object):
             sys.exit()
 
         if len(self.args.x_init) == self.model.n:
-            s_init = state2region(self.args.x_init, self.spec.partition, self.partition['R']['c_tuple'])[0]
+            s_init = state2region(self.args.x_init, self.spec.partition)[0]
             print('In initial state '+str(s_init)+', the following actions are enabled:')
             print([self.actions['obj'][a].center for a in self.actions['enabled'][s_init]])
 
@@ -310,76 +347,84 @@ class Abstraction(object):
             no_error = False
 
         # Initialize variables
-        self.actions['enabled'] = [set() for i in range(self.partition['nr_regions'])]
+        self.actions['enabled'] = enabled_actions(self.partition['nr_regions'])
             
         ## Merge together successor states (per action)
-        enabled_inv_keys = itertools.product(*[enabled_sub_inv[i].keys() 
-                                               for i in range(len(dim_n))])
-        enabled_inv_vals = itertools.product(*[enabled_sub_inv[i].values() 
-                                                for i in range(len(dim_n))])
-        
-        # Precompute matrix to put together control error
-        mats = [None] * len(dim_n)
-        for h,dim in enumerate(dim_n):
-            mats[h] = np.zeros((self.model.n, len(dim)))
-            for j,i in enumerate(dim):
-                mats[h][i,j] = 1
+        H = len(dim_n)
+        sub_keys = [list(enabled_sub_inv[h].keys()) for h in range(H)]
+        
+        # Index (into the keys of every component) of all P products
+        grids = np.meshgrid(*[np.arange(len(keys)) for keys in sub_keys],
+                            indexing='ij')
+        combos = np.stack([g.ravel() for g in grids], axis=1)
+        P = len(combos)
+        
+        # If no action is enabled in one of the subcomponents, then stop
+        if P == 0:
+            return 0
+        
+        # Add tuples to get the compositional target point of all products
+        act_tups = np.zeros((P, self.model.n), dtype=int)
+        for h in range(H):
+            keys_h = np.array(sub_keys[h], dtype=int)
+            act_tups += keys_h[combos[:, h]]
+        
+        act_idxs = self.actions['tup2idx'](act_tups.T)
+        
+        if not no_error:
+            # Put together the control error of all products, by placing the
+            # error of every component in its own dimensions
+            error_pos = np.zeros((P, self.model.n))
+            error_neg = np.zeros((P, self.model.n))
+            for h,dim in enumerate(dim_n):
+                error_pos[:, dim] += np.array([control_error_sub[h][key]['pos']
+                                for key in sub_keys[h]])[combos[:, h]]
+                error_neg[:, dim] += np.array([control_error_sub[h][key]['neg']
+                                for key in sub_keys[h]])[combos[:, h]]
+                
+            if hasattr(self.model, 'Q_uncertain'):
+                # Also account for the uncertain disturbances
+                error_pos += self.model.Q_uncertain['max']
+                error_neg += self.model.Q_uncertain['min']
+        
+        critical_mask = self.partition['critical_mask'].ravel()
         
         nr_act = 0
         
-        # Zipping over the product of the keys/values of the dictionaries
-        for keys, vals_enab in progressbar(zip(enabled_inv_keys, enabled_inv_vals), redirect_stdout=True):
-
-            # Check if we have to save an error term as well
-            if not no_error:
-                vals_error = [control_error_sub[i][key] for i,key in enumerate(keys)]
+        for p in progressbar(range(P), redirect_stdout=True):
             
-            # Add tuples to get the compositional state
-            act_idx = self.actions['tup2idx'][tuple(np.sum(keys, axis=0))]
+            act_idx = act_idxs[p]
             act_obj = self.actions['obj'][act_idx]
             
-            s_elems = list(itertools.product(*vals_enab))
+            # Sum the successor states of all components by broadcasting
+            S = np.zeros((1, self.model.n), dtype=int)
+            for h in range(H):
+                V = np.array(list(enabled_sub_inv[h][sub_keys[h][combos[p, h]]]),
+                             dtype=int).reshape(-1, self.model.n)
+                S = (S[:, None, :] + V[None, :, :]).reshape(-1, self.model.n)
 
             # If action not enabled in one of the subcomponenets, then skip
-            if len(s_elems) == 0:
+            if len(S) == 0:
                 continue
-                
-            s_enabledin  = np.sum(s_elems, axis=1)
             
-            for s in s_enabledin:
-                
-                state = self.partition['R']['idx'][tuple(s)]
-                
-                # Skip if v is a critical state
-                if state in self.partition['critical']:
-                    continue
-                
-                act_obj.enabled_in.add( state )
-                self.actions['enabled'][state].add( act_idx )
+            states = np.ravel_multi_index(S.T, self.spec.partition['number'])
+            
+            # Skip critical states
+            states = states[~critical_mask[states]]
+            
+            act_obj.enabled_in.update( states.tolist() )
+            self.actions['enabled'].add( states, act_idx )
             
             # Check if action is enabled in any state
             if len(act_obj.enabled_in) > 0:
                 nr_act += 1
             
             if not no_error:
-                # Compute control error for this action
-                if hasattr(self.model, 'Q_uncertain'):
-                    # Also account for the uncertain disturbances
-                    act_obj.error = {
-                        'pos': np.sum([mats[z] @ vals_error[z]['pos'] for z in 
-                                    range(len(dim_n))], axis=0) + self.model.Q_uncertain['max'],
-                        'neg': np.sum([mats[z] @ vals_error[z]['neg'] for z in 
-                                    range(len(dim_n))], axis=0) + self.model.Q_uncertain['min']
-                        }
-                
-                else:
-                    # No uncertain disturbance to account for
-                    act_obj.error = {
-                        'pos': np.sum([mats[z] @ vals_error[z]['pos'] for z in 
-                                    range(len(dim_n))], axis=0),
-                        'neg': np.sum([mats[z] @ vals_error[z]['neg'] for z in 
-                                    range(len(dim_n))], axis=0)
-                        }
+                # Control error for this action
+                act_obj.error = {
+                    'pos': error_pos[p],
+                    'neg': error_neg[p]
+                    }
             
         return nr_act
         
@@ -395,11 +440,24 @@ class Abstraction(object):
                         k=self.args.noise_samples) )
 
         else:
-
+            
+            # Factorize the covariance matrix only once (samples themselves
+            # must be drawn fresh on every call)
+            w_cov = np.asarray(self.model.noise['w_cov'], dtype=float)
+            key = w_cov.tobytes()
+            if key not in self._noise_cache:
+                try:
+                    factor = np.linalg.cholesky(w_cov)
+                except np.linalg.LinAlgError:
+                    # Covariance is only positive semi-definite
+                    eigval, eigvec = np.linalg.eigh(w_cov)
+                    factor = eigvec * np.sqrt(np.maximum(eigval, 0))
+                self._noise_cache[key] = factor
+                
             # Compute Gaussian noise samples
-            noise_samples = np.random.multivariate_normal(
-                            np.zeros(self.model.n), self.model.noise['w_cov'], 
-                            size=self.args.noise_samples)
+            noise_samples = self._rng.standard_normal(
+                            size=(self.args.noise_samples, self.model.n)) \
+                            @ self._noise_cache[key].T
 
         return noise_samples
 
@@ -502,8 +560,10 @@ class Abstraction(object):
 
         '''
 
-        rewards_k0 = pd.read_csv(vector_file, header=None).iloc[self.mdp.head:].to_numpy()
-        self.results['optimal_reward'] = rewards_k0.flatten()
+        # The vector file holds one value per line, so parse it directly
+        self.results['optimal_reward'] = np.loadtxt(vector_file, 
+                                    skiprows=self.mdp.head, dtype=np.float64, 
+                                    ndmin=1)
 
         # Convert avoid probability to the safety probability
         if self.spec.problem_type == 'avoid':
@@ -517,23 +577,28 @@ class Abstraction(object):
         else:
 
             # Updated for new PRISM policy/strategy generation (September 2023)
+            # Every line reads as '(state,time):action', so parse the whole
+            # file at once as a CSV with three columns
             with open(policy_file) as f:
-                policy_raw = f.readlines()
+                policy_raw = f.read().replace('(', '').replace(')', '').replace(':', ',')
 
-            import re
-            policy_all = np.full((self.mdp.N, self.mdp.nr_states), fill_value='-1', dtype='<U16')
+            policy_df = pd.read_csv(io.StringIO(policy_raw), header=None, 
+                                    names=['state', 'time', 'action'],
+                                    dtype={'action': str})
 
+            # An action of 'null' means that no action was enabled at all.
+            # Otherwise, the action is read as 'a_100', with '100' the action 
+            # number. Thus, we split the string and only store the number.
+            action_number = pd.to_numeric(policy_df['action'].str.split('_').str[1],
+                                          errors='coerce')
+            
+            keep = (policy_df['state'] >= 0) & action_number.notna()
+            
             # Fill a numpy array with the policy (rows are time steps, columns are states)
             # First row means the action at time k=0, second row at time k=1, etc...
-            for line in policy_raw:
-                line = line.replace('(', '').replace(')', '').replace('\n', '')
-                state, time, action = re.split(r",|:", line)
-                if int(state) >= 0:
-                    # An action of 'null' means that no action was enabled at all
-                    if action != 'null':
-                        # Otherwise, the action is read as 'a_100', with '100' the action number.
-                        # Thus, we split the string and only store the number into the policy matrix.
-                        action_number = action.split('_')[1]
-                        policy_all[int(time), int(state)] = action_number
+            policy_all = np.full((self.mdp.N, self.mdp.nr_states), fill_value=-1, dtype=int)
+            policy_all[policy_df['time'][keep].to_numpy(dtype=int), 
+                       policy_df['state'][keep].to_numpy(dtype=int)] = \
+                action_number[keep].to_numpy(dtype=int)
 
             self.results['optimal_policy'] = policy_all
\ No newline at end of file
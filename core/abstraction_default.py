@@ -6,17 +6,19 @@ from core.define_model import define_model
 
 import numpy as np              # Import Numpy for computations
 import itertools                # Import to create iterators
+import functools                # Import to create partial functions
 import os
 from copy import deepcopy       # Import to copy variables in Python
 from progressbar import progressbar # Import to create progress bars
 from scipy.spatial import Delaunay # Import to create convex hulls
-from operator import itemgetter
 
 from .action_classes import backreachset, partial_model
 from .compute_probabilities import compute_intervals_default
+from .scenario_kernels import sample_regions_batch
 
 from core.define_partition import computeRegionIdx
-from core.commons import tic, ticDiff, tocDiff, table, in_hull
+from core.commons import tic, ticDiff, tocDiff, table, in_hull, parallel_map, \
+    thread_pool
 from core.scenario_approach import load_scenario_table
 
 class abstraction_default(Abstraction):
@@ -116,7 +118,7 @@ class abstraction_default(Abstraction):
 
         #############################
 
-        from .commons import angle_between
+        from .commons import angles_between
         
         def f7(seq):
             seen = set()
@@ -144,7 +146,8 @@ class abstraction_default(Abstraction):
                             upper.astype(int))))
 
         # Also find the corresponding absolute indices of these states
-        state_idxs   = itemgetter(*state_tuples)(self.partition['R']['idx'])
+        state_idxs   = np.ravel_multi_index(np.array(state_tuples).T,
+                                            self.spec.partition['number'])
         
         # Retrieve all corners corresponding to these regions
         selected_regions = [np.unique(r[:, dim_n], axis=0) for r in self.partition['allCorners'][state_idxs,:,:]]
@@ -158,11 +161,10 @@ class abstraction_default(Abstraction):
             basis_vectors = defBasisVectors(model, verbose=verbose)   
 
             if verbose:
-                for i,v1 in enumerate(basis_vectors):
-                    for j,v2 in enumerate(basis_vectors):
-                        if i != j:
-                            print(' ---- Angle between control',i,'and',j,':',
-                                  angle_between(v1,v2) / np.pi * 180)
+                angles = angles_between(basis_vectors) / np.pi * 180
+                for i,j in itertools.permutations(range(len(basis_vectors)), 2):
+                    print(' ---- Angle between control',i,'and',j,':',
+                          angles[i,j])
             
             parralelo2cube = np.linalg.inv( basis_vectors )
             
@@ -198,7 +200,9 @@ class abstraction_default(Abstraction):
             allRegionVertices = region_corners
 
         # For every action
-        for a_tup,a_idx in self.actions['tup2idx'].items(): #progressbar(enumerate(actions['tup2idx']), redirect_stdout=True):
+        for a_idx in range(self.actions['nr_default_act']):
+            
+            a_tup = self.actions['obj'][a_idx].tuple
             
             # If we are in compositional mode, only check this action if all 
             # excluded dimensions are zero        
@@ -295,37 +299,198 @@ class abstraction_default(Abstraction):
         ignore = {}
         regions_list = {}
 
-        noise_samples = Abstraction.noise_sampler(self)
+        # Floating point precision of the samples (single precision halves 
+        # the memory traffic of determining the regions of the samples)
+        dtype = np.dtype(self.setup.sampling.get('dtype', 'float64'))
+
+        noise_samples = np.ascontiguousarray(Abstraction.noise_sampler(self),
+                                             dtype=dtype)
 
         # If block refinement is true, use actual values of successor states,
         # computed in the abstraction on the previous time step
         if self.args.improved_synthesis:
-            successor_states = self.blref.state_relation
+            # Converted once, as it is shared by all (threaded) workers
+            successor_states = np.asarray(self.blref.state_relation)
 
         else:
             successor_states = np.arange(self.partition['nr_regions'])
 
-        # For every action (i.e. target point)
-        for a_idx, act in progressbar(self.actions['obj'].items(), redirect_stdout=True):
+        # Only actions that are available in any state at all
+        enabled_acts = [act for act in self.actions['obj'].values() 
+                        if len(act.enabled_in) > 0]
+        
+        # Bind the data shared by all actions once, instead of looking it up
+        # for every action (chunk)
+        boundary = np.ascontiguousarray(self.spec.partition['boundary'], 
+                                        dtype=np.float64)
+        width = np.asarray(self.spec.partition['width'], dtype=np.float64)
+        number = np.asarray(self.spec.partition['number'], dtype=np.int64)
+        
+        bounds = functools.partial(compute_intervals_default, self.args,
+                                   self.spec.partition, self.partition, 
+                                   self.trans, None, successor_states)
+        cache = getattr(self, 'regions_list_cache', None)
+        actionBounds = self._actionBounds
+        n_jobs = self.args.n_jobs
+        
+        # With the default ('auto') target points, the target point of an
+        # action is the center of a region, so the successor region of a 
+        # sample only depends on its offset (in number of regions) from that
+        # region. The samples are then grouped by offset once, instead of 
+        # determining the region of every sample for every action. The 
+        # lists of regions are cached per sample for the improved synthesis
+        # scheme, so it does not use the grouping.
+        if type(self.spec.targets['number']) == str and \
+          not self.args.improved_synthesis:
+            
+            scaled = noise_samples / width + 0.5
+            
+            # The centers of the regions are rounded to 5 decimals (and the 
+            # shifted samples are rounded to the precision of the samples), 
+            # so samples (almost) on the border of a region may end up in a 
+            # different region than their offset suggests. The same holds for
+            # samples on the upper boundary of the partition, which belong to
+            # the last region. The regions of these samples are determined
+            # individually for every action, in the same way as for other 
+            # actions.
+            tol = (1e-5 + 8 * np.finfo(dtype).eps * np.abs(boundary).max(axis=1)) / width
+            border = np.any(np.abs(scaled - np.rint(scaled)) <= tol, axis=1)
+            border_samples = np.ascontiguousarray(noise_samples[border])
+            
+            offsets, offset_counts = np.unique(
+                np.floor(scaled[~border]).astype(np.int64), axis=0, 
+                return_counts=True)
+            
+            # Number of samples represented by every grouped offset, followed
+            # by the individual samples near a border
+            offset_counts = np.concatenate((offset_counts, 
+                                np.ones(len(border_samples), dtype=np.int64)))
+            
+            print(' --',len(noise_samples),'samples grouped into',
+                  len(offsets),'successor offsets (and',len(border_samples),
+                  'samples near a border)')
+            
+            grouped_acts = [act for act in enabled_acts 
+                            if act.idx < self.actions['nr_default_act']]
+            other_acts = [act for act in enabled_acts 
+                          if act.idx >= self.actions['nr_default_act']]
             
-            # Check if action a is available in any state at all
-            if len(act.enabled_in) > 0:
+        else:
+            
+            offset_counts = None
+            grouped_acts = []
+            other_acts = enabled_acts
+        
+        def chunk_results(executor):
+            '''
+            Compute the probability intervals of all actions, returned lazily
+            in the order of `grouped_acts + other_acts`.
+            '''
+            
+            # The actions share the noise samples, so the samples are 
+            # propagated for a chunk of actions at once (limiting the size of
+            # the region arrays to about 2^24 entries)
+            for acts, weights in [(grouped_acts, offset_counts), 
+                                  (other_acts, None)]:
+            
+                if weights is None:
+                    chunk_size = max(1, 2**24 // len(noise_samples))
+                else:
+                    chunk_size = max(1, 2**24 // (len(weights) * len(number)))
+        
+                for start in range(0, len(acts), chunk_size):
+                
+                    chunk = acts[start:start+chunk_size]
+                
+                    centers = np.array([act.center for act in chunk], 
+                                       dtype=dtype).reshape(-1, len(number))
+                
+                    if cache is not None:
+                        # The cached lists of regions are used instead
+                        regions = [None] * len(chunk)
+                    
+                    elif weights is None:
+                        regions = sample_regions_batch(noise_samples, centers, 
+                                                       boundary, width, number)
                     
-                successor_samples = act.center + noise_samples
+                    else:
+                        # Index tuples of the successor regions of all offsets
+                        tups = np.array([act.tuple for act in chunk])
+                        succ = tups[:, None, :] + offsets[None, :, :]
+                    
+                        inside = np.all((succ >= 0) & (succ < number), axis=2)
+                        regions = np.where(inside, np.ravel_multi_index(
+                            tuple(np.moveaxis(succ, 2, 0)), number, mode='clip'), 
+                            -1)
+                        
+                        # Regions of the individual samples near a border
+                        regions = np.hstack((regions, sample_regions_batch(
+                            border_samples, centers, boundary, width, number)))
                 
-                if hasattr(self, 'regions_list_cache'):
-                    cache = self.regions_list_cache[a_idx]
-                else:
-                    cache = False
+                    # Actions are independent, so compute them in parallel (if 
+                    # enabled)
+                    yield from parallel_map(lambda a: actionBounds(
+                                                chunk[a], regions[a], bounds, 
+                                                cache, weights),
+                                            range(len(chunk)), executor)
+                
+        enabled_acts = grouped_acts + other_acts
 
-                prob[a_idx], regions_list[a_idx], ignore[a_idx] = compute_intervals_default(self.args,
-                    self.spec.partition, self.partition, self.trans,
-                    successor_samples, successor_states, regions_list = cache)
+        with thread_pool(n_jobs) as executor:
+            
+            # For every action (i.e. target point)
+            for act, result in progressbar(zip(enabled_acts, 
+                                               chunk_results(executor)), 
+                                           max_value=len(enabled_acts),
+                                           redirect_stdout=True):
+                
+                prob[act.idx], regions_list[act.idx], ignore[act.idx] = result
 
         if self.args.improved_synthesis and self.blref.initial:
             self.regions_list_cache = regions_list
                 
         return prob, ignore
+    
+    
+    
+    def _actionBounds(self, act, regions, bounds, cache=None, weights=None):
+        '''
+        Compute transition probability intervals (bounds) of a single action
+
+        Parameters
+        ----------
+        act : action object
+            Action to compute the intervals for.
+        regions : 1D Numpy array
+            Region of every noise sample, shifted by the target point of the
+            action (-1 if outside the partition).
+        bounds : function
+            Function to compute the intervals, with all arguments except the
+            list of regions of the samples bound.
+        cache : dict, optional
+            Lists of regions of the samples of every action, computed in a
+            previous iteration. The default is None.
+        weights : 1D Numpy array, optional
+            Number of samples represented by every entry of `regions` (if 
+            the samples are grouped). The default is None.
+
+        Returns
+        -------
+        tuple
+            Computed transition probabilities, list of regions of the 
+            samples, and whether to ignore the action.
+
+        '''
+        
+        if cache is not None:
+            return bounds(regions_list = cache[act.idx])
+        
+        inside = regions >= 0
+        
+        if weights is not None:
+            weights = weights[inside]
+
+        return bounds(regions_list = regions[inside], weights = weights)
 
     
     
@@ -360,14 +525,16 @@ class abstraction_default(Abstraction):
 
             P_low, P_upp = create_table(N=self.args.noise_samples, beta=self.args.confidence, kstep=1, trials=0, export=True)
 
-            self.trans['memory'] = np.column_stack((P_low, P_upp))
+            self.trans['memory_lo'] = np.ascontiguousarray(P_low, dtype=float)
+            self.trans['memory_hi'] = np.ascontiguousarray(P_upp, dtype=float)
 
         else:
             print(' -- Loading scenario approach table...')
 
             # Load scenario approach table
-            self.trans['memory'] = load_scenario_table(tableFile = tableFile,
-                                                    k = self.args.noise_samples)
+            self.trans['memory_lo'], self.trans['memory_hi'] = \
+                load_scenario_table(tableFile = tableFile,
+                                    k = self.args.noise_samples)
         
         print('Computing transition probabilities...')
         
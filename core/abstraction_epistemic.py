@@ -5,15 +5,18 @@ from core.abstraction import Abstraction
 from core.define_model import define_model
 
 import numpy as np              # Import Numpy for computations
+import numba                    # Import Numba to compile hot loops
 import itertools                # Import to create iterators
+import functools                # Import to create partial functions
 from copy import deepcopy       # Import to copy variables in Python
 from progressbar import progressbar # Import to create progress bars
 
 from .action_classes import backreachset, partial_model, epistemic_error, rotate_2D_vector
 from .compute_probabilities import compute_intervals_error
 
-from core.define_partition import computeRegionIdx
-from core.commons import overapprox_box, tic, ticDiff, tocDiff, table
+from core.define_partition import computeRegionIdx, ravel_function
+from core.commons import overapprox_box, tic, ticDiff, tocDiff, table, \
+    parallel_map, thread_pool, bit_table
 from core.cvx_opt import LP_vertices_contained
 from core.scenario_approach import load_scenario_table
 
@@ -92,6 +95,14 @@ class abstraction_epistemic(Abstraction):
                                 np.unique(BRS_0[:, dim_n], axis=0).shape, 
                                 solver=self.setup.cvx['solver'])
         
+        # Precompute the unique vertices of every region, projected on the 
+        # dimensions in dim_n. Since all regions have a positive width, these
+        # are the 2^len(dim_n) combinations of their lower/upper bounds.
+        bitCombinations = bit_table(len(dim_n))
+        region_verts = np.where(bitCombinations[None, :, :],
+                                self.partition['R']['upp'][:, None, dim_n],
+                                self.partition['R']['low'][:, None, dim_n])
+        
         if self.flags['parametric']:
             epist = epistemic_error(model)
         else:
@@ -112,8 +123,13 @@ class abstraction_epistemic(Abstraction):
         else:
             ROT = None
         
+        # Map from the index tuple of a state to its ID
+        tup2region = ravel_function(self.spec.partition['number'])
+        
         # For every action
-        for a_tup,a_idx in self.actions['tup2idx'].items(): #progressbar(enumerate(actions['tup2idx']), redirect_stdout=True):
+        for a_idx in range(self.actions['nr_default_act']):
+            
+            a_tup = self.actions['obj'][a_idx].tuple
             
             # If we are in compositional mode, only check this action if all 
             # excluded dimensions are zero        
@@ -157,13 +173,13 @@ class abstraction_epistemic(Abstraction):
                 tocDiff(False)
                 
                 # Retrieve current state index
-                s_min = self.partition['R']['idx'][s_tup]
+                s_min = tup2region(s_tup)
                 
                 # Skip if this is a critical state
-                if s_min in self.partition['critical'] and not compositional:
+                if not compositional and self.partition['critical_mask'][s_tup]:
                     continue
                 
-                unique_verts = np.unique(self.partition['allCorners'][s_min][:, dim_n], axis=0)
+                unique_verts = region_verts[s_min]
                 
                 # if not ROT is None:
                 if not ROT is None:
@@ -198,7 +214,7 @@ class abstraction_epistemic(Abstraction):
             if not epist is None and len(s_min_list) > 0:
                 
                 # Retrieve list of unique vertices of predecessor states
-                s_vertices = self.partition['allCorners'][s_min_list][:, :, dim_n]
+                s_vertices = region_verts[s_min_list]
                 s_vertices_unique = np.unique(np.vstack(s_vertices), axis=0)
             
                 # Compute the epistemic error
@@ -232,33 +248,24 @@ class abstraction_epistemic(Abstraction):
                 epist = epistemic_error(self.model)
         else:
             epist = None
+            
+        # Potential predecessor states are all non-critical states
+        candidates = np.flatnonzero(~self.partition['critical_mask'].ravel())
 
         for act in self.actions['extra_act']:
                 
-            # Set current backward reachable set as parameter
-            LP.set_backreach(act.backreach_infl)
-            
-            s_min_list = []
-            
-            # Try each potential predecessor state
-            for s_min in range(self.partition['nr_regions']):
-                
-                # Skip if this is a critical state
-                if s_min in self.partition['critical']:
-                    continue
-                
-                unique_verts = np.unique(self.partition['allCorners'][s_min], axis=0)
-                
-                # If the problem is feasible, then action is enabled in this state
-                if LP.solve(unique_verts):
-                    
-                    # Add state to the list of enabled states
-                    s_min_list += [s_min]
-                    
-                    # Enable the current action in the current state
-                    self.actions['enabled'][s_min].add(act.idx)
-                    
-                    act.enabled_in.add(s_min)
+            # Set current backward reachable set as parameter (its half-space
+            # representation is only shifted w.r.t. the default set)
+            LP.set_backreach(act.backreach_infl, act.halfspaces)
+            
+            # Check all potential (non-critical) predecessor states at once
+            contained = LP.batch_contains(self.partition['gridNodes'],
+                                self.partition['region_nodes'][candidates])
+            s_min_list = list(candidates[contained])
+            
+            # Enable the current action in these states
+            self.actions['enabled'].add(s_min_list, act.idx)
+            act.enabled_in.update(s_min_list)
                     
             # Retrieve control error negative/positive
             control_error = act.backreach_obj.target_set_size
@@ -266,9 +273,11 @@ class abstraction_epistemic(Abstraction):
             # If a parametric model is used
             if not epist is None and len(s_min_list) > 0:
                 
-                # Retrieve list of unique vertices of predecessor states
-                s_vertices = self.partition['allCorners'][s_min_list]
-                s_vertices_unique = np.unique(np.vstack(s_vertices), axis=0)
+                # Retrieve list of unique vertices of predecessor states, by
+                # marking their corners on the grid of nodes
+                node_mask = np.zeros(len(self.partition['gridNodes']), dtype=bool)
+                node_mask[self.partition['region_nodes'][s_min_list]] = True
+                s_vertices_unique = self.partition['gridNodes'][node_mask]
             
                 # Compute the epistemic error
                 epist_error_neg, epist_error_pos = epist.compute(s_vertices_unique)
@@ -309,46 +318,32 @@ class abstraction_epistemic(Abstraction):
         prob = dict()
         printEvery = min(100, max(1, int(self.actions['nr_actions']/10)))
 
-        noise_samples = Abstraction.noise_sampler(self)
+        # Floating point precision of the samples and clusters (single 
+        # precision halves the memory traffic of the clustering)
+        dtype = np.dtype(self.setup.sampling.get('dtype', 'float64'))
+
+        noise_samples = Abstraction.noise_sampler(self).astype(dtype)
         
         # Cluster samples
         if self.args.sample_clustering > 0:
             
-            max_radius = float(self.args.sample_clustering)
+            max_radius = dtype.type(self.args.sample_clustering)
+            
+            samples = np.ascontiguousarray(noise_samples)
+            cluster_id = cluster_samples(samples, max_radius)
             
-            remaining_samples       = noise_samples
-            remaining_samples_i     = np.arange(len(noise_samples))
+            # Aggregate the bounds of all clusters in one pass over the
+            # samples, sorted by cluster
+            value = np.bincount(cluster_id)
+            order = np.argsort(cluster_id, kind='stable')
+            starts = np.searchsorted(cluster_id[order], np.arange(value.size))
             
             clusters0 = {
-                'value': [],
-                'lb': [],
-                'ub': []
+                'value': value,
+                'lb': np.minimum.reduceat(samples[order], starts, axis=0),
+                'ub': np.maximum.reduceat(samples[order], starts, axis=0)
                 }
             
-            while len(remaining_samples) > 0:
-                
-                # Compute distance between first samples and all others
-                distances = np.linalg.norm( remaining_samples[0] - 
-                                            remaining_samples, 
-                                            axis=1 )
-                
-                # Add the samples closer than `max_radius` to the first
-                # sample to a new cluster
-                distances_below = distances < max_radius
-                
-                cluster_samples = remaining_samples[ distances_below ]
-                
-                clusters0['value'] += [int(len(remaining_samples_i[ distances_below ]))]
-                clusters0['lb'] += [np.min(cluster_samples, axis=0)]
-                clusters0['ub'] += [np.max(cluster_samples, axis=0)]
-                
-                remaining_samples = remaining_samples[ ~distances_below ]
-                remaining_samples_i = remaining_samples_i[ ~distances_below ]
-                
-            clusters0['value']       = np.array(clusters0['value'])
-            clusters0['lb']          = np.array(clusters0['lb'])
-            clusters0['ub']          = np.array(clusters0['ub'])
-            
             print('--',len(noise_samples),'samples clustered into',
                   len(clusters0['value']),'clusters')
             
@@ -361,44 +356,82 @@ class abstraction_epistemic(Abstraction):
                 'lb': noise_samples,
                 'ub': noise_samples
                 }
-        
-        # For every action (i.e. target point)
-        for a_idx, act in progressbar(self.actions['obj'].items(), redirect_stdout=True):
             
-            # Shift samples by the center of the target set of this action
-            clusters = {
-                'value': clusters0['value'],
-                'lb':    clusters0['lb'] + act.center,
-                'ub':    clusters0['ub'] + act.center
-                }
+        # The clusters are shared by all (threaded) workers, so convert them
+        # to the contiguous arrays used by the compiled kernel once, instead
+        # of copying them for every action
+        clusters0 = {
+            'value': np.ascontiguousarray(clusters0['value'], dtype=np.float64),
+            'lb': np.ascontiguousarray(clusters0['lb']),
+            'ub': np.ascontiguousarray(clusters0['ub'])
+            }
+        
+        # Only actions that are available in any state at all
+        enabled_acts = [act for act in self.actions['obj'].values() 
+                        if len(act.enabled_in) > 0]
+        
+        # Bind the arguments shared by all actions once, instead of looking
+        # them up for every action
+        bounds = functools.partial(compute_intervals_error, self.args, 
+                                   self.spec.partition, self.partition, 
+                                   self.trans, clusters0, verbose=False)
+        actionBounds = self._actionBounds
+        
+        # Actions are independent, so compute them in parallel (if enabled)
+        with thread_pool(self.args.n_jobs) as executor:
+            results = parallel_map(lambda act: actionBounds(act, bounds, dtype),
+                                   enabled_acts, executor)
+        
+            # For every action (i.e. target point)
+            for act, prob_a in progressbar(zip(enabled_acts, results), 
+                                           max_value=len(enabled_acts),
+                                           redirect_stdout=True):
             
-            # Check if action a is available in any state at all
-            if len(act.enabled_in) > 0:
-                
-                # Checking which samples cannot be contained in a region
-                # at the same time is of quadratic complexity in the number
-                # of samples. Thus, we disable this above a certain limit.
-                if True:
-                    exclude = []
-                else:
-                    exclude = exclude_samples(samples, 
-                                      self.spec.partition['width'])
-                
-                prob[a_idx] = compute_intervals_error(self.args, 
-                      self.spec.partition, self.partition, self.trans, 
-                      clusters, act.error, exclude, verbose=False)
+                prob[act.idx] = prob_a
                 
                 # Print normal row in table
-                if a_idx % printEvery == 0:
-                    nr_transitions = len(prob[a_idx]['successor_idxs'])
-                    tab.print_row([a_idx, 
+                if act.idx % printEvery == 0:
+                    nr_transitions = len(prob_a['successor_idxs'])
+                    tab.print_row([act.idx, 
                        'Probabilities computed (transitions: '+
                        str(nr_transitions)+')'])
+        
+        # Write the remaining buffered rows
+        tab.flush()
                 
         return prob
     
     
     
+    def _actionBounds(self, act, bounds, dtype):
+        '''
+        Compute transition probability intervals (bounds) of a single action
+
+        Parameters
+        ----------
+        act : action object
+            Action to compute the intervals for.
+        bounds : function
+            Function to compute the intervals, with all arguments except the
+            (control) error and the shift of the samples bound.
+        dtype : Numpy dtype
+            Floating point precision of the samples.
+
+        Returns
+        -------
+        dict
+            Dictionary containing the computed transition probabilities.
+
+        '''
+        
+        # Shift samples by the center of the target set of this action (the
+        # shift is fused into the computation of the region indices)
+        center = np.asarray(act.center).astype(dtype)
+        
+        return bounds(error=act.error, shift=center)
+    
+    
+    
     def define_probabilities(self):
         '''
         Define the transition probabilities of the finite-state abstraction 
@@ -412,9 +445,9 @@ class abstraction_epistemic(Abstraction):
         
         tocDiff(False)
            
-        # Column widths for tabular prints
+        # Column widths for tabular prints (rows are written in batches)
         col_width = [8,8,46]
-        tab = table(col_width)
+        tab = table(col_width, buffer_size=100)
         
         self.trans = {'prob': {}}
                 
@@ -425,8 +458,9 @@ class abstraction_epistemic(Abstraction):
                         str(self.args.confidence)+'.csv'
         
         # Load scenario approach table
-        self.trans['memory'] = load_scenario_table(tableFile = tableFile,
-                                                   k = self.args.noise_samples)
+        self.trans['memory_lo'], self.trans['memory_hi'] = \
+            load_scenario_table(tableFile = tableFile,
+                                k = self.args.noise_samples)
         
         print('Computing transition probabilities...')
         
@@ -438,16 +472,38 @@ class abstraction_epistemic(Abstraction):
         
         
         
-def exclude_samples(samples, width):
+@numba.njit(cache=True)
+def cluster_samples(samples, max_radius):
+    '''
+    Greedily cluster the samples: the first sample that is not yet in a 
+    cluster starts a new cluster, which contains all remaining samples that
+    are closer than `max_radius` to it. Returns the cluster id of every
+    sample, where clusters are numbered in the order they are created.
+    '''
     
-    N,n = samples.shape
+    N, n = samples.shape
+    max_radius_sq = max_radius * max_radius
     
-    S = np.reshape(samples, (N,n,1))
-    diff = S - S.T
-    width_tile = np.tile(width, (N,1)).T
-    boolean = np.any(diff > width_tile, axis=1) | np.any(diff < -width_tile, axis=1)
+    cluster_id = np.full(N, -1, dtype=np.int64)
     
-    mp = map(np.nonzero, boolean)
-    exclude = [set(m[0]) for m in mp]
+    nr_clusters = 0
+    for i in range(N):
+        if cluster_id[i] != -1:
+            continue
+        
+        # Add the samples closer than `max_radius` to sample i to the cluster
+        for j in range(i, N):
+            if cluster_id[j] != -1:
+                continue
+            
+            dist_sq = 0.0
+            for d in range(n):
+                diff = samples[j,d] - samples[i,d]
+                dist_sq += diff * diff
+                
+            if dist_sq < max_radius_sq:
+                cluster_id[j] = nr_clusters
+        
+        nr_clusters += 1
     
-    return exclude
\ No newline at end of file
+    return cluster_id
\ No newline at end of file
@@ -4,6 +4,7 @@
 import itertools
 import numpy as np
 import cvxpy as cp
+from scipy.spatial import ConvexHull
 
 class action(object):
     '''
@@ -28,11 +29,114 @@ class action(object):
         self.error              = None
         self.enabled_in         = set()
           
-        shift = model.A_inv @ self.center
-        self.backreach = self.backreach_obj.verts + shift
+        self.shift = model.A_inv @ self.center
+        self.backreach = self.backreach_obj.verts + self.shift
         
         if not backreach_obj.target_set_size is None:
-            self.backreach_infl = self.backreach_obj.verts_infl + shift
+            self.backreach_infl = self.backreach_obj.verts_infl + self.shift
+            
+        self._halfspaces = None
+        
+    @property
+    def halfspaces(self):
+        '''
+        Half-space representation (A x <= b) of the inflated backward 
+        reachable set, computed on first use. The set is a shifted copy of 
+        the default set of the backreach object, so only the offsets b differ
+        between actions (None if the convex hull is degenerate).
+        '''
+        
+        if self._halfspaces is None and \
+          not self.backreach_obj.halfspaces is None:
+            A, b = self.backreach_obj.halfspaces
+            self._halfspaces = (A, b + A @ self.shift)
+            
+        return self._halfspaces
+        
+        
+        
+class enabled_actions(object):
+    '''
+    Enabled actions of every state, stored as (state, action) pairs and 
+    compressed to sparse row format (CSR) when read
+    '''
+    
+    def __init__(self, nr_regions, capacity=1024):
+        
+        '''
+        Initialize empty buffers of (state, action) pairs
+        
+        Parameters
+        ----------
+        nr_regions : int
+            Number of states (regions) in the abstraction.
+        capacity : int, optional
+            Initial size of the buffers. The default is 1024.
+        '''
+        
+        self.nr_regions = nr_regions
+        
+        self._states    = np.empty(capacity, dtype=np.int32)
+        self._acts      = np.empty(capacity, dtype=np.int32)
+        self._size      = 0
+        
+        self.indptr     = np.zeros(nr_regions+1, dtype=np.int64)
+        self.indices    = np.empty(0, dtype=np.int32)
+        self._compressed = True
+        
+    def add(self, states, act):
+        '''
+        Enable action `act` in the given state(s)
+        '''
+        
+        states = np.atleast_1d(states)
+        new_size = self._size + len(states)
+        
+        # Grow buffers geometrically
+        if new_size > len(self._states):
+            capacity = max(new_size, 2 * len(self._states))
+            self._states = np.resize(self._states, capacity)
+            self._acts = np.resize(self._acts, capacity)
+            
+        self._states[self._size:new_size] = states
+        self._acts[self._size:new_size] = act
+        self._size = new_size
+        self._compressed = False
+        
+    def compress(self):
+        '''
+        Sort and deduplicate all pairs, and build the CSR arrays
+        '''
+        
+        states = self._states[:self._size]
+        acts = self._acts[:self._size]
+        
+        order = np.lexsort((acts, states))
+        states = states[order]
+        acts = acts[order]
+        
+        # Remove duplicate pairs
+        keep = np.ones(len(states), dtype=bool)
+        keep[1:] = (np.diff(states) != 0) | (np.diff(acts) != 0)
+        
+        self.indices = acts[keep]
+        self.indptr[1:] = np.cumsum(np.bincount(states[keep], 
+                                                minlength=self.nr_regions))
+        self._compressed = True
+        
+    def __getitem__(self, s):
+        '''
+        Return the array of actions enabled in state `s`
+        '''
+        
+        if not self._compressed:
+            self.compress()
+        
+        return self.indices[self.indptr[s]:self.indptr[s+1]]
+    
+    def __len__(self):
+        
+        return self.nr_regions
         
         
         
@@ -46,6 +150,27 @@ class backreachset(object):
         self.name = name
         self.target_set_size = target_set_size
         
+        self._halfspaces = None
+        
+    @property
+    def halfspaces(self):
+        '''
+        Half-space representation (A x <= b) of the default inflated backward
+        reachable set, computed once on first use (None if degenerate).
+        '''
+        
+        if self._halfspaces is None:
+            try:
+                equations = ConvexHull(self.verts_infl).equations
+                self._halfspaces = (equations[:, :-1], -equations[:, -1])
+            except RuntimeError:
+                self._halfspaces = False
+        
+        if self._halfspaces is False:
+            return None
+        else:
+            return self._halfspaces
+        
     def compute_default_set(self, model):
         '''
         Compute the default (inflated) backward reachable set for a target
@@ -5,8 +5,12 @@ import numpy as np              # Import Numpy for computations
 import math                     # Import Math for mathematical operations
 import time                     # Import to create tic/toc functions
 import sys                      # Allows to terminate the code at some point
-import itertools                # Import to crate iterators
 import os                       # Import OS to allow creationg of folders
+import functools                # Import to cache function results
+import contextlib               # Import to create context managers
+from concurrent.futures import ThreadPoolExecutor # Import to run in parallel
+import numba                    # Import Numba to compile hot loops
+import matplotlib.pyplot as plt # Import Pyplot to export figures
 from scipy.spatial import Delaunay
 
 class table(object):
@@ -14,7 +18,7 @@ class table(object):
     Table object, to print structured output in the console.
     '''
     
-    def __init__(self, col_width):
+    def __init__(self, col_width, buffer_size=0):
         '''
         Initialize the table.
 
@@ -22,6 +26,9 @@ class table(object):
         ----------
         col_width : list
             List of column widths for the table to be initialized.
+        buffer_size : int, optional
+            Number of rows to collect before writing them at once (0 means 
+            that every row is printed directly). The default is 0.
 
         Returns
         -------
@@ -29,6 +36,8 @@ class table(object):
 
         '''
         self.col_width = col_width
+        self.buffer_size = buffer_size
+        self._rowbuf = []
         
     def print_row(self, row, head=False, sort=False):
         '''
@@ -48,22 +57,44 @@ class table(object):
         None.
 
         '''
+        lines = []
+        
         if head:
-            print('\n'+'='*sum(self.col_width))
+            lines += ['\n'+'='*sum(self.col_width)]
             
         # Define string
-        string = "".join(str(word).ljust(self.col_width[i]) 
-                         for i,word in enumerate(row))
+        string = "".join(f'{word!s:<{width}}' 
+                         for word,width in zip(row, self.col_width))
         
         if sort == "Warning":
-            print("\u001b[35m"+string+"\x1b[0m")
+            lines += ["\u001b[35m"+string+"\x1b[0m"]
         elif sort == "Success":
-            print("\u001b[32m"+string+"\x1b[0m")
+            lines += ["\u001b[32m"+string+"\x1b[0m"]
         else:
-            print(string)
+            lines += [string]
             
         if head:
-            print('-'*sum(self.col_width))
+            lines += ['-'*sum(self.col_width)]
+            
+        self._rowbuf += lines
+        
+        if len(self._rowbuf) >= self.buffer_size:
+            self.flush()
+            
+    def flush(self):
+        '''
+        Write all buffered rows to the console at once.
+
+        Returns
+        -------
+        None.
+
+        '''
+        
+        if len(self._rowbuf) > 0:
+            sys.stdout.write('\n'.join(self._rowbuf) + '\n')
+            sys.stdout.flush()
+            self._rowbuf = []
 
 
 
@@ -182,17 +213,14 @@ def ticDiff():
     
 
 
+@functools.lru_cache(maxsize=None)
 def nchoosek(n, k):
     '''
     Binomial coefficient or all combinations
     n C k = n! / ( (n-k)! * k! )
     '''
     
-    if k == 0:
-        r = 1
-    else:
-        r = n/k * nchoosek(n-1, k-1)
-    return round(r)
+    return math.comb(n, k)
     
 
 
@@ -319,40 +347,58 @@ def add(v,w):
 
 
 
+@numba.njit(cache=True)
+def pnt2line_nb(px, py, sx, sy, ex, ey):
+    '''
+    Compiled kernel of `pnt2line`, operating on scalar coordinates. Returns
+    the distance and the (x,y) coordinates of the nearest point on the line.
+    '''
+    
+    line_vx = ex - sx
+    line_vy = ey - sy
+    pnt_vx = px - sx
+    pnt_vy = py - sy
+    
+    # Projection of the point on the line, relative to the line length
+    t = (line_vx*pnt_vx + line_vy*pnt_vy) / (line_vx*line_vx + line_vy*line_vy)
+    t = max(0.0, min(1.0, t))
+    nearest_x = line_vx * t
+    nearest_y = line_vy * t
+    dx = pnt_vx - nearest_x
+    dy = pnt_vy - nearest_y
+    dist = math.sqrt(dx*dx + dy*dy)
+    
+    return dist, nearest_x + sx, nearest_y + sy
+
+
+
 def pnt2line(pnt, start, end):
     '''
     Map a point `pnt` to a line from `start` to `end`.
     '''
     
-    line_vec = vector(start, end)
-    pnt_vec = vector(start, pnt)
-    
-    line_len = length(line_vec)
-    line_unitvec = unit(line_vec)
-    pnt_vec_scaled = scale(pnt_vec, 1.0/line_len)
-    t = dot(line_unitvec, pnt_vec_scaled)    
-    if t < 0.0:
-        t = 0.0
-    elif t > 1.0:
-        t = 1.0
-    nearest = scale(line_vec, t)
-    dist = distance(nearest, pnt_vec)
-    nearest = add(nearest, start)
-    return dist, nearest
+    dist, nearest_x, nearest_y = pnt2line_nb(pnt[0], pnt[1], start[0], 
+                                             start[1], end[0], end[1])
+    return dist, (nearest_x, nearest_y)
 
 
 
+@numba.njit(cache=True)
 def point_in_poly(x,y,poly):
     '''
-    Determine which points (x,y) are in the polytope `poly`
+    Determine which points (x,y) are in the polytope `poly`, given as an
+    (n, 2) array of vertices
     '''
 
-    n = len(poly)
+    n = poly.shape[0]
     inside = False
+    xints = 0.0
 
-    p1x,p1y = poly[0]
+    p1x = poly[0,0]
+    p1y = poly[0,1]
     for i in range(n+1):
-        p2x,p2y = poly[i % n]
+        p2x = poly[i % n, 0]
+        p2y = poly[i % n, 1]
         if y > min(p1y,p2y):
             if y <= max(p1y,p2y):
                 if x <= max(p1x,p2x):
@@ -360,12 +406,181 @@ def point_in_poly(x,y,poly):
                         xints = (y-p1y)*(p2x-p1x)/(p2y-p1y)+p1x
                     if p1x == p2x or x <= xints:
                         inside = not inside
-        p1x,p1y = p2x,p2y
+        p1x = p2x
+        p1y = p2y
 
     return inside
 
 
 
+def point_in_poly_ufunc(poly):
+    '''
+    Create a vectorized version of `point_in_poly` for a fixed polytope, which
+    can be called on arrays of x and y coordinates at once.
+
+    Parameters
+    ----------
+    poly : ndarray
+        (n, 2) array of the vertices of the polytope.
+
+    Returns
+    -------
+    Ufunc `f(x, y)` that returns a boolean array of the same shape as x and y.
+
+    '''
+
+    poly = np.ascontiguousarray(poly, dtype=np.float64)
+
+    @numba.vectorize(['boolean(float64, float64)'])
+    def _point_in_poly(x, y):
+        return point_in_poly(x, y, poly)
+
+    return _point_in_poly
+
+
+
+class PolyTest(object):
+    '''
+    Point-in-polytope test for a fixed polytope, which caches the edges such 
+    that repeated queries do not recompute them.
+    '''
+    
+    def __init__(self, poly):
+        '''
+        Initialize the test.
+
+        Parameters
+        ----------
+        poly : ndarray
+            (n, 2) array of the vertices of the polytope.
+
+        Returns
+        -------
+        None.
+
+        '''
+        
+        self.poly = np.ascontiguousarray(poly, dtype=float)
+        
+        # Edges of the polytope (from every vertex to the next one)
+        self.p1x, self.p1y = self.poly[:,0], self.poly[:,1]
+        self.p2x = np.roll(self.p1x, -1)
+        self.p2y = np.roll(self.p1y, -1)
+        
+        self.ymin = np.minimum(self.p1y, self.p2y)
+        self.ymax = np.maximum(self.p1y, self.p2y)
+        self.xmax = np.maximum(self.p1x, self.p2x)
+        self.vertical = self.p1x == self.p2x
+        
+        # Inverse slope of every edge (horizontal edges are never crossed)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.slope = (self.p2x - self.p1x) / (self.p2y - self.p1y)
+        
+    def contains(self, x, y):
+        '''
+        Check if the point (x,y) is in the polytope.
+        '''
+        
+        return point_in_poly(x, y, self.poly)
+    
+    def contains_batch(self, points):
+        '''
+        Check which of the points, given as an (m, 2) array, are in the 
+        polytope. Returns a boolean array of length m.
+        '''
+        
+        points = np.asarray(points, dtype=float)
+        x = points[:, [0]]
+        y = points[:, [1]]
+        
+        with np.errstate(invalid='ignore'):
+            xints = (y - self.p1y) * self.slope + self.p1x
+    
+        crossing = (y > self.ymin) & (y <= self.ymax) & (x <= self.xmax) & \
+                   (self.vertical | (x <= xints))
+    
+        # A point is inside if the ray crosses an odd number of edges
+        return np.count_nonzero(crossing, axis=1) % 2 == 1
+    
+    
+    
+def points_in_poly(points, poly):
+    '''
+    Determine which of the points are in the polytope `poly`, by running the
+    ray-casting test of `point_in_poly` for all points and edges at once.
+
+    Parameters
+    ----------
+    points : ndarray
+        (m, 2) array of points to test.
+    poly : ndarray
+        (n, 2) array of the vertices of the polytope.
+
+    Returns
+    -------
+    Boolean array of length m.
+
+    '''
+
+    return PolyTest(poly).contains_batch(points)
+
+
+
+def thread_pool(n_jobs=1):
+    '''
+    Create a pool of threads to use with parallel_map, as a context manager
+    (which shuts down the threads when leaving it).
+
+    Parameters
+    ----------
+    n_jobs : int, optional
+        Number of threads; -1 uses all CPUs, and 1 runs serially (i.e. the
+        pool is None). The default is 1.
+
+    Returns
+    -------
+    context manager
+        Pool of threads, or None if run serially.
+
+    '''
+    
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    
+    if n_jobs <= 1:
+        return contextlib.nullcontext()
+    
+    return ThreadPoolExecutor(max_workers=n_jobs)
+
+
+
+def parallel_map(func, iterable, executor=None):
+    '''
+    Apply a function to every element of an iterable, using a pool of threads
+    (results are returned lazily, in the order of the iterable).
+
+    Parameters
+    ----------
+    func : function
+        Function to apply.
+    iterable : iterable
+        Elements to apply the function to.
+    executor : ThreadPoolExecutor, optional
+        Pool of threads created with thread_pool. The default is None, which 
+        runs serially.
+
+    Returns
+    -------
+    iterator
+        Results of the function for every element.
+
+    '''
+    
+    if executor is None:
+        return map(func, iterable)
+    
+    return executor.map(func, iterable)
+
 def cm2inch(*tupl):
     '''
     Convert centimeters to inches
@@ -379,6 +594,54 @@ def cm2inch(*tupl):
 
 
 
+def savefig_formats(fig, filename, formats):
+    '''
+    Save a figure in multiple formats. The tight bounding box is computed 
+    only once, instead of re-rendering the figure to compute it for every 
+    format.
+
+    Parameters
+    ----------
+    fig : Figure
+        Figure to save.
+    filename : str
+        Filename (without extension) to save the figure to.
+    formats : list
+        List of file formats (extensions) to save the figure in.
+
+    Returns
+    -------
+    None.
+
+    '''
+    
+    get_renderer = getattr(fig.canvas, 'get_renderer', None)
+    if get_renderer is not None:
+        # Draw the figure first, so the bounding box matches the saved figure
+        fig.canvas.draw()
+        bbox = fig.get_tightbbox(get_renderer()).padded(
+                    plt.rcParams['savefig.pad_inches'])
+    else:
+        bbox = 'tight'
+    
+    for form in formats:
+        fig.savefig(filename+'.'+str(form), format=form, bbox_inches=bbox)
+
+
+
+def show_figure(fig, plotting):
+    '''
+    Show the figure if this is enabled in the plotting settings, and close 
+    it otherwise (such that figures do not accumulate in batch runs).
+    '''
+    
+    if plotting.get('show', True):
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+
 def floor_decimal(a, precision=0):
     '''
     Floor function, but than with a specific precision
@@ -458,8 +721,12 @@ def setStateBlock(partition, **kwargs):
         else:
             
             row[i] = list(value)
+    
+    # Cartesian product of the coordinates, in the same (row-major) order as
+    # itertools.product
+    grid = np.meshgrid(*row, indexing='ij')
             
-    return np.array(list(itertools.product(*row)))
+    return np.stack(grid, axis=-1).reshape(-1, stateDim)
 
 
 
@@ -479,11 +746,53 @@ def angle_between(v1, v2):
             >>> angle_between((1, 0, 0), (-1, 0, 0))
             3.141592653589793
     """
-    v1_u = unit_vector(v1)
-    v2_u = unit_vector(v2)
-    return np.arccos(np.clip(np.dot(v1_u, v2_u), -1.0, 1.0))
+    return angles_between([v1], [v2])[0,0]
+
+
+
+def angles_between(V1, V2=None):
+    '''
+    Compute the angles (in radians) between all pairs of rows of `V1` and 
+    `V2` at once. If `V2` is not given, the angles between the rows of `V1` 
+    are returned.
+
+    Parameters
+    ----------
+    V1 : 2D Numpy array
+        Array of vectors (one per row).
+    V2 : 2D Numpy array, optional
+        Array of vectors (one per row). The default is None.
+
+    Returns
+    -------
+    2D Numpy array
+        Matrix with element (i,j) the angle between V1[i] and V2[j].
+
+    '''
+    
+    V1 = np.asarray(V1, dtype=float)
+    V2 = V1 if V2 is None else np.asarray(V2, dtype=float)
+    
+    U1 = V1 / np.linalg.norm(V1, axis=1, keepdims=True)
+    U2 = V2 / np.linalg.norm(V2, axis=1, keepdims=True)
+    
+    return np.arccos(np.clip(U1 @ U2.T, -1.0, 1.0))
 
 
 
 def flatten(t):
-    return [item for sublist in t for item in sublist]
\ No newline at end of file
+    return [item for sublist in t for item in sublist]
+
+
+
+def bit_table(n):
+    '''
+    Create all combinations of n bits, as a boolean array of shape (2^n, n). 
+    Row k holds the bits of integer k (most significant bit first), which is
+    the same order as itertools.product([0, 1], repeat=n).
+    '''
+    
+    idx = np.arange(2**n, dtype=np.uint64)
+    shifts = np.arange(n-1, -1, -1, dtype=np.uint64)
+    
+    return ((idx[:, None] >> shifts) & np.uint64(1)).astype(bool)
\ No newline at end of file
@@ -2,17 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-import itertools
 import matplotlib.pyplot as plt # Import Pyplot to generate plots
 import matplotlib.patches as patches
-from operator import itemgetter
-import collections
 
-from .commons import cm2inch, floor_decimal, tocDiff
-from .define_partition import computeRegionIdx, computeRegionCenters, draw_hull
+from .scenario_kernels import scenario_counts_error
+from .commons import cm2inch, floor_decimal, tocDiff, savefig_formats, show_figure
+from .define_partition import computeRegionCenters, draw_hull, \
+    rectangle_collection
 
 def compute_intervals_error(args, partition_setup, partition, trans, 
-                                clusters, error, exclude=False, verbose=False):
+                                clusters, error, verbose=False, shift=0):
     '''
     Compute the transition probability intervals
 
@@ -30,8 +29,12 @@ def compute_intervals_error(args, partition_setup, partition, trans,
         Dictionary of cluster information
     error : dict
         Control/epistemic error dictionary
-    samples : 2D Numpy array
-        Numpy array, with every row being a sample of the process noise.
+    verbose : bool, optional
+        If True, print the number of partially outside samples. The default
+        is False.
+    shift : 1D Numpy array, optional
+        Vector by which all clusters are shifted (i.e. the target point of 
+        the action). The default is 0.
 
     Returns
     -------
@@ -40,134 +43,47 @@ def compute_intervals_error(args, partition_setup, partition, trans,
 
     '''
     
-    # tocDiff(False)
-    if len(exclude) > 0:
-        check_exclude = True
-    else:
-        check_exclude = False
-    
     Nsamples = args.noise_samples
     
-    # Initialize counts array
-    counts_low = np.zeros(partition_setup['number'])
-    counts_upp = np.zeros(partition_setup['number'])
-    
-    i_excl = {}
-
-    # If hoeffding inequality is used to obtain upper bound probabilities,
-    # then we don't modify the uncertainty boxes
-    imin, iMin = computeRegionIdx(clusters['lb'] + error['neg'], partition_setup)
-    imax, iMax = computeRegionIdx(clusters['ub'] + error['pos'], partition_setup,
-                                  borderOutside=[True]*len(clusters['value']))
-    
-    epsilon = np.sqrt( 1/(2*Nsamples) * np.log(
-                2/args.confidence) )
-    
-    counts_absorb_low = 0
-    counts_absorb_upp = 0
-    
-    counts_goal_low = 0
-    counts_goal_upp = 0
-    
-    counts_critical_low = 0
-    counts_critical_upp = 0
-    
     nrPerDim = np.array(partition_setup['number'])
     
-    ###
-    
-    # Compute number of samples fully outside of partition.
-    # If all indices are outside the partition, then it is certain that 
-    # this sample is outside the partition
-    fully_out = (imax < 0).any(axis=1) + (imin > nrPerDim - 1).any(axis=1)
-    counts_absorb_low = clusters['value'][fully_out].sum()
+    # Offsets (relative to the lower corner of the partition) of the lower
+    # and upper bounds of all clusters
+    offset = partition_setup['width']*nrPerDim/2 - partition_setup['origin']
     
-    # Determine samples that are partially outside
-    partially_out = (imin < 0).any(axis=1) + (imax > nrPerDim - 1).any(axis=1)
+    # If hoeffding inequality is used to obtain upper bound probabilities,
+    # then we don't modify the uncertainty boxes. The (lower and upper bound)
+    # counts of all regions, and of the absorbing, goal, and critical states,
+    # are determined in a single compiled pass over the clusters.
+    counts_low, counts_upp, totals = scenario_counts_error(
+        np.ascontiguousarray(clusters['lb']), 
+        np.ascontiguousarray(clusters['ub']),
+        np.asarray(shift + error['neg'] + offset, dtype=np.float64),
+        np.asarray(shift + error['pos'] + offset, dtype=np.float64),
+        np.asarray(partition_setup['width'], dtype=np.float64),
+        nrPerDim.astype(np.int64),
+        partition['goal_mask'].reshape(-1),
+        partition['critical_mask'].reshape(-1),
+        np.asarray(clusters['value'], dtype=np.float64))
+    
+    counts_absorb_low, counts_absorb_upp, counts_goal_low, counts_goal_upp, \
+        counts_critical_low, counts_critical_upp = totals
+    counts_absorb_upp = int(counts_absorb_upp)
     
     if verbose:
-        print('Partially out sum:', partially_out.sum())
+        print('Partially out sum:', counts_absorb_upp)
     
-    counts_absorb_upp = clusters['value'][partially_out].sum().astype(int)
-    
-    # If we precisely know where the sample is, and it is not outside the
-    # partition, then add one to both lower and upper bound count
-    in_single_region = (imin == imax).all(axis=1) * np.bitwise_not(fully_out)
-    
-    for key,val in zip (imin[in_single_region], 
-                        clusters['value'][in_single_region]):
-        key = tuple(key)
-        if key in partition['goal_idx']:
-            counts_goal_low += val
-            counts_goal_upp += val
-        
-        elif key in partition['critical_idx']:
-            counts_critical_low += val
-            counts_critical_upp += val
-        
-        else:
-            counts_low[key] += val
-            counts_upp[key] += val
-            
-    keep = ~in_single_region & ~fully_out
-    iMin_rem = iMin[keep]
-    iMax_rem = iMax[keep]
-    c_rem    = np.arange( len(clusters['value']) )[keep]
-            
-    ###
-    
-    # For the remaining samples, only increment the upper bound count
-    for x,c in enumerate(c_rem):        
-        counts_upp[ tuple(map(slice, iMin_rem[x], iMax_rem[x]+1)) ] += clusters['value'][c]
-        
-        '''
-        if check_exclude:
-          for key in itertools.product(*map(np.arange, iMin_rem[x], iMax_rem[x]+1)):
-            
-                # If first occurence of this region, this just add it
-                if key not in i_excl:
-                    i_excl[key] = {c}
-                    
-                # If not first occurence of region
-                else:
-                    # Check if there is a conflicting sample in there, then 
-                    # skip this region (ONE TIME!)
-                    union = i_excl[key] & exclude[c]
-                    
-                    if len(union) == 0:
-                        i_excl[key].add(c)
-                        
-                    else:
-                        counts_upp[key] -= 1
-                        i_excl[key].pop()
-        '''
-                
-        index_tuples = set(itertools.product(*map(range, iMin_rem[x], iMax_rem[x]+1)))
-        
-        # Check if all are goal states
-        if index_tuples.issubset( partition['goal_idx'] ) and not partially_out[x]:
-            counts_goal_low += clusters['value'][c]
-            counts_goal_upp += clusters['value'][c]
-            
-        # Check if all are critical states
-        elif index_tuples.issubset( partition['critical_idx'] ) and not partially_out[x]:
-            counts_critical_low += clusters['value'][c]
-            counts_critical_upp += clusters['value'][c]
-            
-        # Otherwise, check if part of them are goal/critical states
-        else:
-            if not index_tuples.isdisjoint( partition['goal_idx'] ):
-                counts_goal_upp += clusters['value'][c]
-                
-            if not index_tuples.isdisjoint( partition['critical_idx'] ):
-                counts_critical_upp += clusters['value'][c]
+    epsilon = np.sqrt( 1/(2*Nsamples) * np.log(
+                2/args.confidence) )
     
     ###
     
-    counts_nonzero = [[partition['R']['idx'][idx], counts_low[idx], cu] 
-                        for idx, cu in np.ndenumerate(counts_upp) if cu > 0 
-                        and idx not in partition['goal_idx'] 
-                        and idx not in partition['critical_idx']]
+    # Regions with a nonzero count that are not goal/critical
+    nonzero = (counts_upp > 0) & ~partition['goal_mask'].reshape(-1) & \
+                                 ~partition['critical_mask'].reshape(-1)
+    counts_nonzero = np.column_stack((
+        np.flatnonzero(nonzero),
+        counts_low[nonzero], counts_upp[nonzero] ))
     
     counts_header = []
     if len(partition['critical_idx']) > 0:
@@ -175,17 +91,18 @@ def compute_intervals_error(args, partition_setup, partition, trans,
     if len(partition['goal_idx']) > 0:
         counts_header += [[-1, counts_goal_low, counts_goal_upp]]
     
-    counts = np.array(counts_header + counts_nonzero, dtype = int)
+    counts = np.vstack((np.reshape(counts_header, (-1, 3)), 
+                        counts_nonzero)).astype(int)
     
     # Number of samples not in any region (i.e. in absorbing state)
     deadlock_low = np.maximum(0, counts_absorb_low / Nsamples - epsilon)    
-    deadlock_upp = 1 - trans['memory'][counts_absorb_upp][0]
+    deadlock_upp = 1 - trans['memory_lo'][counts_absorb_upp]
 
     if len(counts) > 0:
         discard_upp = np.minimum(Nsamples - counts[:, 1], Nsamples)
         
         # Compute lower bound probability
-        probability_low     = trans['memory'][discard_upp, 0]
+        probability_low     = trans['memory_lo'][discard_upp]
         
         # Compute upper bound probability either with hoeffding's bound
         probability_upp     = np.minimum(1, counts[:, 2] / Nsamples + epsilon)
@@ -207,10 +124,8 @@ def compute_intervals_error(args, partition_setup, partition, trans,
     probs_ub = np.minimum(1,    floor_decimal(probability_upp, nr_decimals))
     
     # Create interval strings (only entries for prob > 0)
-    interval_strings = ["["+
-                      str(lb)+","+
-                      str(ub)+"]"
-                      for (lb, ub) in zip(probs_lb, probs_ub)]
+    interval_strings = ['[%s,%s]' % bounds for bounds in 
+                        zip(probs_lb.tolist(), probs_ub.tolist())]
     
     # Compute deadlock, goal, and critical probability intervals
     deadlock_lb = np.maximum(Pmin, floor_decimal(deadlock_low, nr_decimals))
@@ -223,7 +138,7 @@ def compute_intervals_error(args, partition_setup, partition, trans,
     probability_approx = np.round(probability_approx, nr_decimals)
     
     # Create approximate prob. strings (only entries for prob > 0)
-    approx_strings = [str(p) for p in probability_approx]
+    approx_strings = list(map(str, probability_approx.tolist()))
     
     # Compute approximate deadlock transition probabilities
     deadlock_approx = np.round(1-sum(probability_approx), nr_decimals)
@@ -241,7 +156,8 @@ def compute_intervals_error(args, partition_setup, partition, trans,
 
 
 def compute_intervals_default(args, partition_setup, partition, trans, samples, 
-                              successor_indices, regions_list = False, nr_decimals = 5,):
+                              successor_indices, regions_list, nr_decimals = 5,
+                              weights = None):
     '''
     Compute the transition probability intervals
 
@@ -259,6 +175,11 @@ def compute_intervals_default(args, partition_setup, partition, trans, samples,
         Numpy array, with every row being a sample of the process noise.
     successor_indices : list
         List of successor state indices (used for improved synthesis scheme)
+    regions_list : 1D Numpy array
+        Regions of the samples that are within the partition.
+    weights : 1D Numpy array, optional
+        Number of samples represented by every entry of `regions_list`. The
+        default is None (i.e. one sample per entry).
 
     Returns
     -------
@@ -270,27 +191,18 @@ def compute_intervals_default(args, partition_setup, partition, trans, samples,
 
     Nsamples = args.noise_samples
 
-    if not regions_list:
-        # Only keep those samples that are within the partitioned portion of the state space
-        samples = samples[np.all(samples >= partition_setup['boundary'][:,0], axis=1) * 
-                        np.all(samples <= partition_setup['boundary'][:,1], axis=1)]
-
-        # Relative value to lower boundary
-        samples_rel = samples - partition_setup['boundary'][:,0]
-
-        # Determine the indices of the respective samples
-        index = (samples_rel // partition_setup['width']).astype(int)
-        index_tuples = map(tuple, index)
-
-        regions_list = list(itemgetter(*index_tuples)(partition['R']['idx']))
-
     #### CONVERT FROM REGION COUNT TO VALUE PARTITION COUNT
-    states_list = successor_indices[regions_list]
-    count_dict = collections.Counter(states_list)
+    # Histogram over all successor states in a single pass (no sorting)
+    successor_indices = np.asarray(successor_indices)
+    counts = np.bincount(successor_indices[regions_list], weights=weights,
+                         minlength=np.max(successor_indices)+1)
+    
+    if weights is not None:
+        counts = np.rint(counts).astype(int)
 
     # Determine probability intervals
-    successor_idxs = np.fromiter(count_dict.keys(), dtype=int)
-    counts_value = np.fromiter(count_dict.values(), dtype=int)
+    successor_idxs = np.flatnonzero(counts)
+    counts_value = counts[successor_idxs]
 
     if args.improved_synthesis and all(successor_idxs == 0):
         ignore = True
@@ -298,21 +210,22 @@ def compute_intervals_default(args, partition_setup, partition, trans, samples,
         ignore = False
 
     #### PROBABILITY INTERVALS
-    probs_lb = floor_decimal(trans['memory'][Nsamples - counts_value, 0], nr_decimals)
-    probs_ub = floor_decimal(trans['memory'][Nsamples - counts_value, 1], nr_decimals)
+    # Gather the lower and upper bounds for all successors at once
+    probs_lb = floor_decimal(trans['memory_lo'][Nsamples - counts_value], nr_decimals)
+    probs_ub = floor_decimal(trans['memory_hi'][Nsamples - counts_value], nr_decimals)
     
     # Create interval strings (only entries for prob > 0)
-    interval_strings = ["["+
-                      str(floor_decimal(max(1e-4, lb),5))+","+
-                      str(floor_decimal(min(1,    ub),5))+"]"
-                      for (lb, ub) in zip(probs_lb, probs_ub)]
+    probs_lb = floor_decimal(np.maximum(1e-4, probs_lb), 5)
+    probs_ub = floor_decimal(np.minimum(1,    probs_ub), 5)
+    interval_strings = ['[%s,%s]' % bounds for bounds in 
+                        zip(probs_lb.tolist(), probs_ub.tolist())]
     
     # Count number of samples not in any region (i.e. in absorbing state)
     k_deadlock = int( Nsamples - sum(counts_value) )
 
     # Compute deadlock probability intervals
-    deadlock_lb = floor_decimal(1 - trans['memory'][k_deadlock][1], nr_decimals)
-    deadlock_ub = floor_decimal(1 - trans['memory'][k_deadlock][0], nr_decimals)
+    deadlock_ub = floor_decimal(1 - trans['memory_lo'][k_deadlock], nr_decimals)
+    deadlock_lb = floor_decimal(1 - trans['memory_hi'][k_deadlock], nr_decimals)
     
     deadlock_string = '['+ \
                        str(floor_decimal(max(1e-4, deadlock_lb),5))+','+ \
@@ -322,7 +235,7 @@ def compute_intervals_default(args, partition_setup, partition, trans, samples,
     probability_approx = np.round(counts_value / Nsamples, nr_decimals)
     
     # Create approximate prob. strings (only entries for prob > 0)
-    approx_strings = [str(p) for p in probability_approx]
+    approx_strings = list(map(str, probability_approx.tolist()))
     
     # Compute approximate deadlock transition probabilities
     deadlock_approx = np.round(1-sum(probability_approx), nr_decimals)
@@ -383,27 +296,21 @@ def transition_plot(samples, error, i_show, i_hide, args, setup, model, spec, pa
     
     ax.set_title("N = "+str(args.noise_samples),fontsize=10)
     
-    # Draw goal states
-    for goal in partition['goal']:
-        
-        if all(partition['R']['center'][goal, list(i_hide)] == cut_value):
-        
-            goal_lower = partition['R']['low'][goal, [is1, is2]]
-            goalState = patches.Rectangle(goal_lower, width=width[is1], 
-                                  height=width[is2], color="green", 
-                                  alpha=0.3, linewidth=None)
-            ax.add_patch(goalState)
-    
-    # Draw critical states
-    for crit in partition['critical']:
-        
-        if all(partition['R']['center'][crit, list(i_hide)] == cut_value):
+    # Determine which regions are in the shown cross-section (project the 
+    # centers on the hidden dimensions once)
+    show_idx = np.array([is1, is2], dtype=np.intp)
+    hide_idx = np.asarray(i_hide, dtype=np.intp)
+    centers_hide = np.ascontiguousarray(partition['R']['center'][:, hide_idx])
+    in_cut = np.all(centers_hide == np.asarray(cut_value, dtype=float), axis=1)
+    
+    # Draw goal and critical states (as one collection each)
+    for regions, color in [(partition['goal'], 'green'), 
+                           (partition['critical'], 'red')]:
         
-            critStateLow = partition['R']['low'][crit, [is1, is2]]
-            criticalState = patches.Rectangle(critStateLow, width=width[is1], 
-                                      height=width[is2], color="red", 
-                                      alpha=0.3, linewidth=None)
-            ax.add_patch(criticalState)
+        regions = np.array(regions, dtype=int)
+        lower = partition['R']['low'][regions[in_cut[regions]]][:, show_idx]
+        ax.add_collection(rectangle_collection(lower, width[show_idx], 
+                                               color=color, alpha=0.3))
     
     with plt.rc_context({"font.size": 5}):        
         # Draw every X-th label
@@ -411,7 +318,7 @@ def transition_plot(samples, error, i_show, i_hide, args, setup, model, spec, pa
             skip = 1
             for i in range(0, partition['nr_regions'], skip):
                 
-                if all(partition['R']['center'][i, list(i_hide)] == cut_value):
+                if in_cut[i]:
                                 
                     ax.text(partition['R']['center'][i,is1], 
                             partition['R']['center'][i,is2], i, \
@@ -437,14 +344,13 @@ def transition_plot(samples, error, i_show, i_hide, args, setup, model, spec, pa
         
     if type(backreach_inflated) == np.ndarray:
         
-        draw_hull(backreach_inflated, color='blue')
+        draw_hull(backreach_inflated, color='blue', verbose=args.verbose)
             
     # Set tight layout
     fig.tight_layout()
     
     # Save figure
     filename = setup.directories['outputFcase']+'transition_plot'
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-    plt.show()
\ No newline at end of file
+    show_figure(plt.gcf(), setup.plotting)
\ No newline at end of file
@@ -41,6 +41,10 @@ class mdp(object):
         
         # Specify sets that can never reach target set
         self.badStates  = partition['critical']
+        
+        # Boolean masks (over region IDs) for constant-time membership tests
+        self.goal_mask      = partition['goal_mask'].ravel()
+        self.critical_mask  = partition['critical_mask'].ravel()
     
     def writePRISM_specification(self, mode, problem_type):
         '''
@@ -164,9 +168,9 @@ class mdp(object):
                 substring += ' 1'
             
             # Check if region is in goal set
-            if i in self.goodStates:
+            if self.goal_mask[i]:
                 substring += ' 2' 
-            elif i in self.badStates:
+            elif self.critical_mask[i]:
                 substring += ' 3'
             
             label_body[i] = substring
@@ -192,10 +196,10 @@ class mdp(object):
         # For every state
         for s in progressbar(range(self.nr_regions), redirect_stdout=True):
             
-            if s in partition['goal']:
+            if self.goal_mask[s]:
                 # print(' ---- Skip',s,'because it is a goal region')
                 continue
-            if s in partition['critical']:
+            if self.critical_mask[s]:
                 # print(' ---- Skip',s,'because it is a critical region')
                 continue
             
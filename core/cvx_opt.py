@@ -3,6 +3,7 @@
 
 import cvxpy as cp
 import numpy as np
+from scipy.spatial import ConvexHull
 
 class Controller(object):
     
@@ -77,11 +78,58 @@ class LP_vertices_contained(object):
         obj = cp.Minimize(cp.sum(self.alpha))
         self.prob = cp.Problem(obj, constraints)
         
-    def set_backreach(self, BRS_inflated):
+    def set_backreach(self, BRS_inflated, halfspaces=False):
         
         # Set current backward reachable set as parameter
         self.G_curr.value = BRS_inflated
         
+        # Half-space representation (A x <= b) of the backward reachable 
+        # set, or None if its convex hull is degenerate (computed here, 
+        # unless it is provided)
+        if halfspaces is False:
+            try:
+                equations = ConvexHull(BRS_inflated).equations
+                halfspaces = (equations[:, :-1], -equations[:, -1])
+            except RuntimeError:
+                halfspaces = None
+                
+        self.halfspaces = halfspaces
+        
+    def batch_contains(self, vertices, vert_idx, tol=1e-6):
+        '''
+        Check for multiple regions at once if all their vertices are contained
+        in the current backward reachable set.
+
+        Parameters
+        ----------
+        vertices : 2D Numpy array
+            Pool of vertices shared by all regions, with shape (nr_vertices, n).
+        vert_idx : 2D Numpy array
+            Index (into the pool) of the unique vertices of every region, with
+            shape (nr_regions, 2^n).
+        tol : float, optional
+            Tolerance on the half-space constraints. The default is 1e-6.
+
+        Returns
+        -------
+        contained : 1D Numpy array
+            Boolean for every region, which is True if the region is contained.
+
+        '''
+        
+        if self.halfspaces is None:
+            # Fall back to solving one LP for every region
+            return np.array([self.solve(vertices[idx]) for idx in vert_idx], 
+                            dtype=bool)
+        
+        A, b = self.halfspaces
+        
+        # Every vertex in the pool is checked only once, and shared between
+        # all regions it is a corner of
+        inside = ((A @ vertices.T - b[:, None]) <= tol).all(axis=0)
+        
+        return inside[vert_idx].all(axis=1)
+        
     def solve(self, vertices):
         
         self.P_vertices.value = vertices
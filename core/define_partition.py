@@ -4,13 +4,13 @@
 import numpy as np              # Import Numpy for computations
 import itertools                # Import to crate iterators
 import matplotlib.pyplot as plt # Import Pyplot to generate plots
-import matplotlib.patches as patches
 
 from scipy.spatial import ConvexHull
-from matplotlib.patches import Rectangle
-import matplotlib.patches as patches
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
 
-from .commons import cm2inch
+from .commons import cm2inch, savefig_formats, show_figure
 
 def computeRegionCenters(points, partition):
     '''
@@ -67,16 +67,77 @@ def computeRegionCenters(points, partition):
 
 
 
-def state2region(state, partition, c_tuple):
+def state2region(state, partition):
 
-    region_centers = computeRegionCenters(state, partition)
+    region_idx = center_to_index(state, partition)
 
-    try:
-        region_idx = [c_tuple[tuple(c)] for c in region_centers]
-        return region_idx
-    except:
+    if np.any(region_idx < 0):
         print('ERROR: state',state,'does not belong to any region')
         return False
+    else:
+        return list(region_idx)
+
+
+
+def ravel_function(number):
+    '''
+    Create a function that maps the index tuple of a single region to its 
+    (row-major) ID, which is equivalent to np.ravel_multi_index for the given 
+    number of regions per dimension, but avoids its overhead per call.
+
+    Parameters
+    ----------
+    number : list
+        Number of regions in every dimension.
+
+    Returns
+    -------
+    function
+        Function mapping an index tuple to the ID of the region.
+
+    '''
+    
+    # Strides are fixed for the partition, so compute them only once
+    strides = tuple(int(np.prod(number[d+1:])) for d in range(len(number)))
+    
+    def ravel(tup):
+        return sum([i * s for i,s in zip(tup, strides)])
+    
+    return ravel
+
+
+
+def center_to_index(points, partition):
+    '''
+    Compute the IDs of the regions that a list of points (e.g. region 
+    centers) belong to. Since the partition is a uniform grid, the ID follows
+    directly from the index of the region in every dimension.
+
+    Parameters
+    ----------
+    points : 2D Numpy array
+        Array, with every row being a point to determine the region for.
+    partition : dict
+        Dictionary of the partition.
+
+    Returns
+    -------
+    Numpy array
+        ID of the region of every point (-1 if outside of the partition).
+
+    '''
+    
+    points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+    number = np.asarray(partition['number'])
+    
+    indices, _ = computeRegionIdx(points, partition)
+    inside = np.all((indices >= 0) & (indices < number), axis=1)
+    
+    region_idx = np.full(len(points), -1, dtype=np.int64)
+    region_idx[inside] = np.ravel_multi_index(tuple(indices[inside].T), 
+                                              number)
+    
+    return region_idx
 
 
 
@@ -102,13 +163,15 @@ def computeRegionIdx(points, partition, borderOutside=False):
     pointsZero = points - partition['origin'] + \
                     partition['width']*partition['number']/2
 
-    indices = (pointsZero // partition['width']).astype(int)
+    # Partitions have far fewer than 2^31 regions per dimension, so 32-bit 
+    # indices suffice and halve the memory traffic
+    indices = (pointsZero // partition['width']).astype(np.int32)
     
     # Reduce index by one if it is exactly on the border
     indices -= ((pointsZero % partition['width'] == 0).T * borderOutside).T
     
     indices_nonneg = np.minimum(np.maximum(0, indices), 
-                                np.array(partition['number'])-1).astype(int)
+                                np.array(partition['number'])-1).astype(np.int32)
     
     return indices, indices_nonneg
 
@@ -147,76 +210,75 @@ def define_partition(dim, nrPerDim, regionWidth, origin):
                                      (nrPerDim[i]-1)/2,
                                      int(nrPerDim[i]))
         
-    widthArrays = [[x*regionWidth[i] for x in elemVector[i]] 
-                                              for i in range(dim)]
+    widthArrays = [elemVector[i] * regionWidth[i] for i in range(dim)]
     
-    idxArrays = [range(len(arr)) for arr in widthArrays]
+    nr_regions = np.prod(nrPerDim)
     
+    # Centers of all regions at once, in row-major order of their index
+    grid = np.meshgrid(*widthArrays, indexing='ij')
+    center = np.stack([g.ravel() for g in grid], axis=1) + origin
     
-    nr_regions = np.prod(nrPerDim)
-    partition = {'center': np.zeros((nr_regions, dim), dtype=float), 
-                 'idx': {},
-                 'c_tuple': {}}
+    dec = 5
     
-    partition['low'] = np.zeros((nr_regions, dim), dtype=float)
-    partition['upp'] = np.zeros((nr_regions, dim), dtype=float)
+    partition = {
+        'center': np.round(center, decimals=dec),
+        'low': np.round(center - regionWidth/2, decimals=dec),
+        'upp': np.round(center + regionWidth/2, decimals=dec)
+        }
     
-    for i,(pos,idx) in enumerate(zip(itertools.product(*widthArrays),
-                                     itertools.product(*idxArrays))):
-        
-        center = np.array(pos) + origin
-        
-        dec = 5
-        
-        partition['center'][i] = np.round(center, decimals=dec)
-        partition['c_tuple'][tuple(np.round(center, decimals=dec))] = i
-        partition['low'][i] = np.round(center - regionWidth/2, 
-                                        decimals=dec)
-        partition['upp'][i] = np.round(center + regionWidth/2, 
-                                        decimals=dec)
-        partition['idx'][tuple(idx)] = i
+    # Regions are enumerated in row-major order of their index (in every 
+    # dimension), so the ID of a region follows from center_to_index, 
+    # instead of a dictionary lookup
     
     return partition
 
 
 
-def define_spec_region(allCenters, sets, partition, borderOutside=False):
+def define_spec_region(sets, partition, borderOutside=False):
     '''
     Return the indices of regions associated with the unique centers.
 
     Parameters
     ----------
-    allCenters : List
-        List of the center coordinates for all regions.
+    sets : 3D Numpy array
+        Array of boxes, of shape (number of boxes, n, 2), to return the 
+        regions for.
     partition : Dict
         Partition dictionary.
-    subset : List
-        List of points to return the unique centers for.
+    borderOutside : bool, optional
+        If True, points on the border of a region are assigned to the lower
+        region. The default is False.
 
     Returns
     -------
     list
-        List of unique center points.
+        List of indices of the regions in the sets.
+    dict
+        Minimum and maximum indices of every set.
+    set
+        Set of index tuples of the regions in the sets.
+    Numpy array
+        Boolean mask over the partition, which is True for these regions.
 
     '''
     
     delta = 1e-5
     
-    if sets is None:
-        return [], [], set()
+    if sets is None or len(sets) == 0:
+        return [], [], set(), np.zeros(partition['number'], dtype=bool)
     
     else:
     
         points = [None] * len(sets)
         slices = {'min': [None] * len(sets), 'max': [None] * len(sets)}
-        index_tuples = set()
+        mask = np.zeros(partition['number'], dtype=bool)
         
         # Convert regions to all individual points (centers of regions)
         for i,set_boundary in enumerate(sets):
         
-            set_boundary = np.array([
-                            S if type(S) != str else partition['boundary'][j] 
-                            for j,S in enumerate(set_boundary) ])
+            # Unbounded dimensions span the full partition
+            set_boundary = np.where(np.isinf(set_boundary), 
+                                    partition['boundary'], set_boundary)
             
             # Increase by small margin to avoid issues on region boundaries
             set_boundary = np.hstack((set_boundary[:,[0]] + delta, 
@@ -229,8 +291,8 @@ def define_spec_region(allCenters, sets, partition, borderOutside=False):
             slices['min'][i] = indices_nonneg.min(axis=0)
             slices['max'][i] = indices_nonneg.max(axis=0)
             
-            # Create slices
-            index_tuples.update(set(itertools.product(*map(range, slices['min'][i], slices['max'][i]+1))))
+            # Mark the block of regions between the min/max indices
+            mask[tuple(map(slice, slices['min'][i], slices['max'][i]+1))] = True
             
             # Define iterator
             if borderOutside:
@@ -249,15 +311,19 @@ def define_spec_region(allCenters, sets, partition, borderOutside=False):
         # Filter to only keep unique centers
         centers_unique = np.unique(centers, axis=0)
         
-        states = [allCenters[tuple(c)] for c in centers_unique 
-                           if tuple(c) in allCenters]
+        # Look up all centers at once (centers that are not in the partition
+        # are dropped)
+        states = center_to_index(centers_unique, partition)
+        states = states[states >= 0].tolist()
+        
+        index_tuples = set(map(tuple, np.argwhere(mask).tolist()))
         
         if len(states) != len(index_tuples):
             print('ERROR: lengths of goal and goal_idx lists are not the same.')
             assert False
         
         # Return the ID's of regions associated with the unique centers            
-        return states, slices, index_tuples
+        return states, slices, index_tuples, mask
         
 
 
@@ -268,6 +334,11 @@ def partition_plot(i_show, i_hide, Ab, cut_value, act=None, stateLabels=False):
     
     is1, is2 = i_show
     
+    # Convert the index lists once, instead of in every loop iteration
+    show_idx = np.array([is1, is2], dtype=int)
+    hide_idx = np.asarray(i_hide, dtype=np.intp)
+    cut_arr = np.asarray(cut_value, dtype=float)
+    
     fig, ax = plt.subplots(figsize=cm2inch(6.1, 5))
     
     plt.xlabel('Var $1$', labelpad=0)
@@ -284,30 +355,22 @@ def partition_plot(i_show, i_hide, Ab, cut_value, act=None, stateLabels=False):
     ticks_x = np.round(np.linspace(min_xy[is1], max_xy[is1], number[is1]+1), 4)
     ticks_y = np.round(np.linspace(min_xy[is2], max_xy[is2], number[is2]+1), 4)
     
+    # Only label every X-th tick; the others become (invisible) minor ticks
     show_every = np.round(number / 5)
-    ticks_x_labels = [v if i % show_every[is1] == 0 else '' for i,v in enumerate(ticks_x)]
-    ticks_y_labels = [v if i % show_every[is2] == 0 else '' for i,v in enumerate(ticks_y)]
+    labeled_x = np.arange(len(ticks_x)) % show_every[is1] == 0
+    labeled_y = np.arange(len(ticks_y)) % show_every[is2] == 0
     
     # Set ticks and tick labels
-    ax.set_xticks(ticks_x)
-    ax.set_yticks(ticks_y)
-    ax.set_xticklabels(ticks_x_labels)
-    ax.set_yticklabels(ticks_y_labels)
-    
-    # x-axis
-    for i, tic in enumerate(ax.xaxis.get_major_ticks()):
-        if ticks_x_labels[i] == '':
-            tic.tick1line.set_visible(False)
-            tic.tick2line.set_visible(False)
-    
-    # y-axis
-    for i, tic in enumerate(ax.yaxis.get_major_ticks()):
-        if ticks_y_labels[i] == '':
-            tic.tick1line.set_visible(False)
-            tic.tick2line.set_visible(False)
+    ax.set_xticks(ticks_x[labeled_x])
+    ax.set_yticks(ticks_y[labeled_y])
+    ax.set_xticklabels(ticks_x[labeled_x])
+    ax.set_yticklabels(ticks_y[labeled_y])
+    ax.set_xticks(ticks_x[~labeled_x], minor=True)
+    ax.set_yticks(ticks_y[~labeled_y], minor=True)
+    ax.tick_params(which='minor', length=0)
     
     # Show gridding of the state space
-    plt.grid(which='major', color='#CCCCCC', linewidth=0.3)
+    plt.grid(which='both', color='#CCCCCC', linewidth=0.3)
     
     # Goal x-y limits
     min_xy_scaled = 1.5 * (min_xy - origin) + origin
@@ -318,27 +381,18 @@ def partition_plot(i_show, i_hide, Ab, cut_value, act=None, stateLabels=False):
     
     ax.set_title("Partition plot", fontsize=10)
     
-    # Draw goal states
-    for goal in Ab.partition['goal']:
-        
-        if all(Ab.partition['R']['center'][goal, list(i_hide)] == cut_value):
-        
-            goal_lower = Ab.partition['R']['low'][goal, [is1, is2]]
-            goalState = patches.Rectangle(goal_lower, width=width[is1], 
-                                  height=width[is2], color="green", 
-                                  alpha=0.3, linewidth=None)
-            ax.add_patch(goalState)
-    
-    # Draw critical states
-    for crit in Ab.partition['critical']:
-        
-        if all(Ab.partition['R']['center'][crit, list(i_hide)] == cut_value):
+    # Determine which regions are in the shown cross-section
+    centers_hide = np.ascontiguousarray(Ab.partition['R']['center'][:, hide_idx])
+    in_cut = np.all(centers_hide == cut_arr, axis=1)
+    
+    # Draw goal and critical states (as one collection each)
+    for regions, color in [(Ab.partition['goal'], 'green'), 
+                           (Ab.partition['critical'], 'red')]:
         
-            critStateLow = Ab.partition['R']['low'][crit, [is1, is2]]
-            criticalState = patches.Rectangle(critStateLow, width=width[is1], 
-                                      height=width[is2], color="red", 
-                                      alpha=0.3, linewidth=None)
-            ax.add_patch(criticalState)
+        regions = np.array(regions, dtype=int)
+        lower = Ab.partition['R']['low'][regions[in_cut[regions]]][:, show_idx]
+        ax.add_collection(rectangle_collection(lower, width[show_idx], 
+                                               color=color, alpha=0.3))
     
     with plt.rc_context({"font.size": 5}):        
         # Draw every X-th label
@@ -346,7 +400,7 @@ def partition_plot(i_show, i_hide, Ab, cut_value, act=None, stateLabels=False):
             skip = 1
             for i in range(0, Ab.partition['nr_regions'], skip):
                 
-                if all(Ab.partition['R']['center'][i, list(i_hide)] == cut_value):
+                if in_cut[i]:
                                 
                     ax.text(Ab.partition['R']['center'][i,is1], 
                             Ab.partition['R']['center'][i,is2], i, \
@@ -357,46 +411,84 @@ def partition_plot(i_show, i_hide, Ab, cut_value, act=None, stateLabels=False):
         
         plt.scatter(act.center[is1], act.center[is2], c='red', s=20)
         
-        print(' - Print backward reachable set of action', act.idx)
-        draw_hull(act.backreach, color='red')
+        if Ab.args.verbose:
+            print(' - Print backward reachable set of action', act.idx)
+        draw_hull(act.backreach, color='red', verbose=Ab.args.verbose)
         
         if hasattr(act, 'backreach_infl'):
-            draw_hull(act.backreach_infl, color='blue')
+            draw_hull(act.backreach_infl, color='blue', 
+                      verbose=Ab.args.verbose)
         
-        for s in act.enabled_in:
-            center = Ab.partition['R']['center'][s]
-            plt.scatter(center[is1], center[is2], c='blue', s=8)
+        # Plot the centers of all states the action is enabled in at once
+        enabled_in = np.fromiter(act.enabled_in, dtype=int)
+        centers = Ab.partition['R']['center'][enabled_in][:, show_idx]
+        plt.scatter(centers[:,0], centers[:,1], c='blue', s=8)
     
     # Set tight layout
     fig.tight_layout()
     
     # Save figure
     filename = Ab.setup.directories['outputF']+'partition_plot'
-    for form in Ab.setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, Ab.setup.plotting['exportFormats'])
         
-    plt.show()
+    show_figure(plt.gcf(), Ab.setup.plotting)
 
 
 
-def draw_hull(points, color, linewidth=0.1):
+def rectangle_collection(lower, size, **kwargs):
+    '''
+    Create a single collection of axis-aligned rectangles, which is much 
+    faster to draw than adding every rectangle as a separate patch.
 
-    # Plot hull of the vertices        
-    try: 
-        hull = ConvexHull(points)
-        
-        # Get the indices of the hull points.
-        hull_indices = hull.vertices
-        
-        # These are the actual points.
-        hull_pts = points[hull_indices, :]
-        
-        plt.fill(hull_pts[:,0], hull_pts[:,1], fill=False, edgecolor=color, lw=linewidth)
-        
-        print('Convex hull plotted')
-        
-    except:
+    Parameters
+    ----------
+    lower : 2D Numpy array
+        Array with every row being the lower-left corner of a rectangle.
+    size : Numpy array
+        Width and height of the rectangles.
+    **kwargs : 
+        Keyword arguments passed to the PolyCollection.
+
+    Returns
+    -------
+    PolyCollection
+
+    '''
+    
+    w, h = size
+    offsets = np.array([[0, 0], [w, 0], [w, h], [0, h]])
+    verts = np.reshape(lower, (-1, 1, 2)) + offsets
+    
+    return PolyCollection(verts, **kwargs)
+
+
+
+def draw_hull(points, color, linewidth=0.1, verbose=False):
+    
+    # A hull needs at least three distinct points that are not collinear 
+    # (i.e. that span the plane), so draw a line otherwise
+    if len(np.unique(points, axis=0)) < 3 or \
+        np.linalg.matrix_rank(points - points.mean(axis=0)) < 2:
         plt.plot(points[:,0], points[:,1],
                  color=color, lw=linewidth)
         
-        print('Line plotted')
\ No newline at end of file
+        if verbose:
+            print('Line plotted')
+        return
+
+    # Plot hull of the vertices        
+    hull = ConvexHull(points)
+    
+    # Get the indices of the hull points.
+    hull_indices = hull.vertices
+    
+    # These are the actual points.
+    hull_pts = points[hull_indices, :]
+    
+    # Draw the hull as a single closed path
+    path = Path(np.vstack((hull_pts, hull_pts[:1])), closed=True)
+    plt.gca().add_patch(PathPatch(path, fill=False, edgecolor=color, 
+                                  lw=linewidth))
+    
+    if verbose:
+        print('Convex hull plotted')
\ No newline at end of file
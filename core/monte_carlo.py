@@ -17,7 +17,7 @@ import pandas as pd             # Import Pandas to store data in frames
 import random                   # Import to use random variables
 from progressbar import progressbar # Import to create progress bars
 
-from .define_partition import computeRegionCenters
+from .define_partition import center_to_index
 from .commons import tocDiff, table
 from .cvx_opt import Controller
 
@@ -183,23 +183,16 @@ class MonteCarloSim():
         while k <= self.horizon:
             
             # Determine to which region the state belongs
-            region_center = computeRegionCenters(x[k], 
-                    self.spec.partition).flatten()
+            x_region[k] = center_to_index(x[k], self.spec.partition)[0]
 
-            if tuple(region_center) in self.partition['R']['c_tuple']:
-                # Save that state is currently in region ii
-                x_region[k] = self.partition['R']['c_tuple'][tuple(region_center)]
-                
-            else:
+            if x_region[k] == -1:
                 # Absorbing region reached
-                x_region[k] = -1
-
                 if self.args.verbose:
                     self.tab.print_row([s_init, m, k, 'Absorbing state reached, so abort'], sort="Warning")
                 return trace, success
 
             # If current region is the goal state ... 
-            if x_region[k] in self.partition['goal']:
+            if self.partition['goal_mask'].flat[x_region[k]]:
                 # Then abort the current iteration, as we have achieved the goal
                 success = True
                 if self.args.verbose:
@@ -207,7 +200,7 @@ class MonteCarloSim():
                 return trace, success
                 
             # If current region is in critical states...
-            elif x_region[k] in self.partition['critical']:
+            elif self.partition['critical_mask'].flat[x_region[k]]:
                 # Then abort current iteration
                 if self.args.verbose:
                     self.tab.print_row([s_init, m, k, 'Critical state reached, so abort'], sort="Warning")
@@ -62,6 +62,9 @@ def parse_arguments():
     parser.add_argument('--nongaussian_noise', dest='nongaussian_noise', action='store_true',
                         help="If enabled, non-Gaussian noise samples (if available) are used")
     parser.set_defaults(nongaussian_noise=False)
+    
+    parser.add_argument('--n_jobs', type=int, action="store", dest='n_jobs', 
+                        default=1, help="Number of threads to compute probability intervals with (-1 uses all CPUs)")
 
 
 
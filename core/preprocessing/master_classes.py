@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt # Import to generate plos using Pyplot
 import seaborn as sns           # Import Seaborn to plot heat maps
 from datetime import datetime   # Import Datetime to retreive current date/time
 import math                     # Import Math for mathematical operations
+import numpy as np              # Import Numpy for computations
 
 from core.commons import createDirectory
 
@@ -163,10 +164,14 @@ class settings(object):
         plot = dict()
         # TRUE/FALSE setup whether plots should be generated
         plot['exportFormats']           = ['pdf','png']
+        # Show plots after exporting them (otherwise, figures are closed to 
+        # free their memory, e.g. for batch runs)
+        plot['show']                    = True
         
         self.mdp = mdp
         self.plotting = plot
-        self.sampling = {}
+        # Precision of the noise samples ('float64' or 'float32')
+        self.sampling = {'dtype': 'float64'}
         self.time = timing
         self.directories = directories
         self.cvx = {'solver': 'ECOS'}
@@ -255,4 +260,28 @@ class spec_master(object):
         self.noise = {}
         self.control = {}
         self.error = {}
-        
\ No newline at end of file
+        
+    def set_boxes(self):
+        '''
+        Pack the goal and critical sets into numeric arrays of boxes, of 
+        shape (number of sets, n, 2), where 'all' is replaced by (-inf, inf).
+
+        Returns
+        -------
+        None.
+
+        '''
+        
+        n = len(self.partition['boundary'])
+        
+        self.goal_box = self.pack_boxes(self.goal, n)
+        self.critical_box = self.pack_boxes(self.critical, n)
+        
+    @staticmethod
+    def pack_boxes(sets, n):
+        
+        if sets is None:
+            return np.empty((0, n, 2))
+        
+        return np.array([[(-np.inf, np.inf) if type(S) == str else S 
+                          for S in box] for box in sets], dtype=np.float64)
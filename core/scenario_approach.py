@@ -15,8 +15,12 @@ def load_scenario_table(tableFile, k):
 
     Returns
     -------
-    memory : dict
-        Dictionary containing all loaded probability bounds / intervals.
+    memory_lo : 1D Numpy array
+        Array of length k+1, where element i is the lower probability bound
+        for i discarded samples.
+    memory_hi : 1D Numpy array
+        Array of length k+1, where element i is the upper probability bound
+        for i discarded samples.
 
     '''
     
@@ -24,6 +28,18 @@ def load_scenario_table(tableFile, k):
         sys.exit('ERROR: the following table file does not exist:'+
                     str(tableFile))
     
+    # Binary copy of the table, which is generated on the first load and 
+    # memory-mapped afterwards (such that the CSV file is parsed only once)
+    binaryFile = os.path.splitext(tableFile)[0] + '.npy'
+    
+    if os.path.isfile(binaryFile) and \
+      os.path.getmtime(binaryFile) >= os.path.getmtime(tableFile):
+        
+        memory = np.load(binaryFile, mmap_mode='r')
+        
+        if memory.shape == (2, k+1):
+            return memory[0], memory[1]
+    
     with open(tableFile, newline='') as csvfile:
         reader = csv.reader(csvfile, delimiter=' ', quotechar='|')
         
@@ -38,5 +54,15 @@ def load_scenario_table(tableFile, k):
             
             value = [float(i) for i in strSplit[-2:]]
             memory[int(strSplit[0])] = value
-                
-    return memory
\ No newline at end of file
+    
+    # Separate contiguous arrays for the lower and upper bounds, such that a
+    # bound is gathered directly by the number of discarded samples
+    memory = np.ascontiguousarray(memory.T)
+    
+    try:
+        np.save(binaryFile, memory)
+    except OSError:
+        print('WARNING: could not store binary copy of the table at:',
+              binaryFile)
+    
+    return memory[0], memory[1]
\ No newline at end of file
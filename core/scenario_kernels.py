@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import numba
+
+# Compiled kernels to count the (clustered) noise samples per region of the 
+# partition. To debug these kernels as plain Python, set the environment 
+# variable NUMBA_DISABLE_JIT=1.
+
+@numba.njit(cache=True, nogil=True)
+def scenario_counts_error(lb, ub, offset_lb, offset_ub, width, number,
+                          goal_mask, critical_mask, values):
+    '''
+    Count the clusters of samples (inflated by the control error) that are 
+    contained in every region of the partition, in a single pass over the
+    clusters. A cluster is counted for the lower bound only if it is within
+    a single region, and for the upper bound in all regions it may be in. 
+    Upper bounds exactly on the border of a region are assigned to the region 
+    below. Counts and masks are flattened (row-major) arrays over the 
+    partition.
+    
+    Returns the lower and upper bound counts, and the totals for the 
+    absorbing (lower/upper), goal (lower/upper), and critical (lower/upper)
+    states.
+    '''
+    
+    N, n = lb.shape
+    
+    # Row-major strides of the partition
+    strides = np.ones(n, dtype=np.int64)
+    for d in range(n-2, -1, -1):
+        strides[d] = strides[d+1] * number[d+1]
+    
+    counts_low = np.zeros(strides[0] * number[0])
+    counts_upp = np.zeros(strides[0] * number[0])
+    totals = np.zeros(6)
+    
+    iMin = np.empty(n, dtype=np.int64)
+    iMax = np.empty(n, dtype=np.int64)
+    idx = np.empty(n, dtype=np.int64)
+    
+    for c in range(N):
+        val = values[c]
+        
+        fully_out = False
+        partially_out = False
+        single = True
+        
+        # Indices of the regions of the lower and upper bound of the cluster
+        for d in range(n):
+            z = lb[c,d] + offset_lb[d]
+            lo = int(z // width[d])
+            
+            z = ub[c,d] + offset_ub[d]
+            hi = int(z // width[d])
+            if z % width[d] == 0:
+                hi -= 1
+                
+            if hi < 0 or lo > number[d]-1:
+                fully_out = True
+            if lo < 0 or hi > number[d]-1:
+                partially_out = True
+            if lo != hi:
+                single = False
+            
+            iMin[d] = min(max(lo, 0), number[d]-1)
+            iMax[d] = min(max(hi, 0), number[d]-1)
+        
+        if partially_out:
+            totals[1] += val
+        
+        # If all indices are outside the partition, then it is certain that 
+        # this cluster is outside the partition
+        if fully_out:
+            totals[0] += val
+            continue
+        
+        all_goal = True
+        all_critical = True
+        any_goal = False
+        any_critical = False
+        
+        # Iterate over all regions in the box between iMin and iMax
+        for d in range(n):
+            idx[d] = iMin[d]
+        while True:
+            flat = 0
+            for d in range(n):
+                flat += idx[d] * strides[d]
+            
+            counts_upp[flat] += val
+            if single:
+                counts_low[flat] += val
+                
+            if goal_mask[flat]:
+                any_goal = True
+            else:
+                all_goal = False
+            if critical_mask[flat]:
+                any_critical = True
+            else:
+                all_critical = False
+            
+            d = n-1
+            while d >= 0:
+                idx[d] += 1
+                if idx[d] <= iMax[d]:
+                    break
+                idx[d] = iMin[d]
+                d -= 1
+            if d < 0:
+                break
+        
+        # Check if all are goal states
+        if all_goal and not partially_out:
+            totals[2] += val
+            totals[3] += val
+            
+        # Check if all are critical states
+        elif all_critical and not partially_out:
+            totals[4] += val
+            totals[5] += val
+            
+        # Otherwise, check if part of them are goal/critical states
+        else:
+            if any_goal:
+                totals[3] += val
+            if any_critical:
+                totals[5] += val
+    
+    return counts_low, counts_upp, totals
+
+
+
+@numba.njit(cache=True, nogil=True)
+def sample_regions_batch(samples, shifts, boundary, width, number):
+    '''
+    Determine the region of every sample, shifted by every row of `shifts`
+    (i.e. the target points of multiple actions), in a single pass over the
+    samples. Returns an array of shape (number of shifts, number of samples),
+    which is -1 for samples outside the partitioned portion of the space.
+    '''
+    
+    N, n = samples.shape
+    A = shifts.shape[0]
+    
+    # Row-major strides of the partition
+    strides = np.ones(n, dtype=np.int64)
+    for d in range(n-2, -1, -1):
+        strides[d] = strides[d+1] * number[d+1]
+    
+    regions = np.full((A, N), -1, dtype=np.int64)
+    
+    for i in range(N):
+        for a in range(A):
+            region = 0
+            for d in range(n):
+                x = samples[i,d] + shifts[a,d]
+                if x < boundary[d,0] or x > boundary[d,1]:
+                    region = -1
+                    break
+                
+                # Samples exactly on the upper boundary belong to the last 
+                # region
+                idx = min(int((x - boundary[d,0]) // width[d]), number[d]-1)
+                region += idx * strides[d]
+            
+            regions[a,i] = region
+    
+    return regions
@@ -4,6 +4,8 @@
 from matplotlib import pyplot as plt
 from matplotlib import cm
 
+from core.commons import savefig_formats, show_figure
+
 
 def heatmap_3D(setup, centers, values, ev = 2):
     '''
@@ -50,7 +52,6 @@ def heatmap_3D(setup, centers, values, ev = 2):
 
     # Save figure
     filename = setup.directories['outputFcase']+'3D_heatmap'
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-    plt.show()
\ No newline at end of file
+    show_figure(plt.gcf(), setup.plotting)
\ No newline at end of file
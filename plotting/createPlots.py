@@ -7,8 +7,8 @@ import matplotlib.pyplot as plt # Import Pyplot to generate plots
 import seaborn as sns
 from matplotlib import cm
 
-from core.commons import printWarning, mat_to_vec, cm2inch
-from core.define_partition import define_partition
+from core.commons import printWarning, cm2inch, savefig_formats, show_figure
+from core.define_partition import define_partition, center_to_index
 
 def set_axes_equal(ax: plt.Axes):
     """
@@ -82,10 +82,9 @@ def reachability_plot(setup, results, mc=None):
                 
     # Save figure
     filename = setup.directories['outputFcase']+'reachability_probability'
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
     
-    plt.show()
+    show_figure(plt.gcf(), setup.plotting)
     
 
 
@@ -102,15 +101,19 @@ def heatmap_3D_view(model, setup, spec, region_centers, results):
         # Plot 3D probability results
         plot3D      = dict()
         
-        plot3D['x'] = np.reshape(region_centers[:,0], (m[0],m[1]))
-        plot3D['y'] = np.reshape(region_centers[:,1], (m[0],m[1]))
+        # Views on the (row-major) grid of region centers
+        grid = np.ascontiguousarray(region_centers, dtype=float).reshape(
+                                                        m[0], m[1], -1)
+        plot3D['x'] = grid[:,:,0]
+        plot3D['y'] = grid[:,:,1]
 
         # Create figure
         fig = plt.figure(figsize=cm2inch(8,5.33))
         ax  = plt.axes(projection='3d')
 
         # Determine matrix of probability values
-        Z   = np.reshape(results['optimal_reward'], (m[0],m[1]))
+        Z   = np.ascontiguousarray(results['optimal_reward'], 
+                                   dtype=float).reshape(m[0],m[1])
         
         # Plot the surface
         surf = ax.plot_surface(plot3D['x'], plot3D['y'], Z, 
@@ -124,13 +127,9 @@ def heatmap_3D_view(model, setup, spec, region_centers, results):
         
         # Set title and axis format
         ax.title.set_text('Reachability probability at time k = 0')
-        x_row = mat_to_vec( plot3D['x'] )
-        y_col = mat_to_vec( plot3D['y'] )
         n_ticks = 5
-        plt.xticks(np.arange(min(x_row), max(x_row)+1, \
-                             (max(x_row) - min(x_row))/n_ticks ))
-        plt.yticks(np.arange(min(y_col), max(y_col)+1, \
-                             (max(y_col) - min(y_col))/n_ticks ))
+        plt.xticks(np.linspace(plot3D['x'].min(), plot3D['x'].max(), n_ticks+1))
+        plt.yticks(np.linspace(plot3D['y'].min(), plot3D['y'].max(), n_ticks+1))
         plt.tick_params(pad=-3)
             
         plt.xlabel('x_1', labelpad=-6)
@@ -143,15 +142,13 @@ def heatmap_3D_view(model, setup, spec, region_centers, results):
         filename = setup.directories['outputFcase']+\
             '3d_reachability_k=0'
         
-        for form in setup.plotting['exportFormats']:
-            plt.savefig(filename+'.'+str(form), format=form, 
-                        bbox_inches='tight')
+        savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-        plt.show()
+        show_figure(plt.gcf(), setup.plotting)
         
         
     
-def heatmap_2D(args, model, setup, c_tuple, spec, values, title = 'auto'):
+def heatmap_2D(args, model, setup, spec, values, title = 'auto'):
     '''
     Create heat map for the reachability probability from any initial state.
 
@@ -198,22 +195,23 @@ def heatmap_2D(args, model, setup, c_tuple, spec, values, title = 'auto'):
         print('ERROR: No suitable model type found for 2D heatmap')
         return
 
-    cut_values = np.zeros((x_nr, y_nr))
-    cut_coords = np.zeros((x_nr, y_nr, model.n))
+    # Use one contiguous float array of the cut centers for all lookups
+    cut_centers = np.ascontiguousarray(cut_centers, dtype=np.float64)
     
-    cut_idxs = [c_tuple[tuple(c)] for c in cut_centers 
-                if tuple(c) in c_tuple]              
+    # Region index of every center in the cut (-1 if not in the partition)
+    cut_idxs = center_to_index(cut_centers, spec.partition)
+    found = cut_idxs >= 0
     
-    for i,(idx,center) in enumerate(zip(cut_idxs, cut_centers)):
-        
-        j = i % y_nr
-        k = i // y_nr
-        
-        cut_values[k,j] = values[idx] 
-        cut_coords[k,j,:] = center
+    # Gather the values of all regions in the cut at once
+    cut_values = np.zeros(len(cut_centers))
+    cut_values[found] = np.asarray(values)[cut_idxs[found]]
+    
+    cut_values = cut_values.reshape(x_nr, y_nr)
     
-    cut_df = pd.DataFrame( cut_values, index=cut_coords[:,0,0], 
-                           columns=cut_coords[0,:,1] )
+    # The centers are in row-major order, so the first column of every 
+    # y_nr-th row and the second column of the first y_nr rows give the axes
+    cut_df = pd.DataFrame( cut_values, index=cut_centers[::y_nr, 0], 
+                           columns=cut_centers[:y_nr, 1] )
     
     fig = plt.figure(figsize=cm2inch(9, 8))
     ax = sns.heatmap(cut_df.T, cmap="jet", #YlGnBu
@@ -234,7 +232,6 @@ def heatmap_2D(args, model, setup, c_tuple, spec, values, title = 'auto'):
     # Save figure
     filename = setup.directories['outputFcase']+'2D_Heatmap_N=' + \
                 str(args.noise_samples)
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-    plt.show()
\ No newline at end of file
+    show_figure(plt.gcf(), setup.plotting)
\ No newline at end of file
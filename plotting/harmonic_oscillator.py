@@ -4,12 +4,14 @@
 import numpy as np              # Import Numpy for computations
 import pandas as pd             # Import Pandas to store data in frames
 import matplotlib.pyplot as plt # Import Pyplot to generate plots
+import seaborn as sns
 
 # Load main classes and methods
 from matplotlib.patches import Rectangle
 import matplotlib.patches as patches
 
-from core.commons import printWarning, cm2inch
+from core.commons import printWarning, cm2inch, savefig_formats, show_figure
+from core.define_partition import define_partition, center_to_index
 from core.monte_carlo import MonteCarloSim
 
 def oscillator_heatmap(Ab, title = 'auto'):
@@ -27,9 +29,6 @@ def oscillator_heatmap(Ab, title = 'auto'):
 
     '''
     
-    import seaborn as sns
-    from ..define_partition import define_partition
-
     x_nr = Ab.spec.partition['number'][0]
     y_nr = Ab.spec.partition['number'][1]
         
@@ -37,29 +36,27 @@ def oscillator_heatmap(Ab, title = 'auto'):
            Ab.spec.partition['width'], 
            Ab.spec.partition['origin'])['center']
                           
-    cut_values = np.zeros((x_nr, y_nr))
-    cut_coords = np.zeros((x_nr, y_nr, Ab.model.n))
+    # Use one contiguous float array of the cut centers for all lookups
+    cut_centers = np.ascontiguousarray(cut_centers, dtype=np.float64)
     
-    cut_idxs = [Ab.partition['R']['c_tuple'][tuple(c)] for c in cut_centers 
-                                   if tuple(c) in Ab.partition['R']['c_tuple']]              
+    # Region index of every center in the cut (-1 if not in the partition)
+    cut_idxs = center_to_index(cut_centers, Ab.spec.partition)
+    found = cut_idxs >= 0
     
-    for i,(idx,center) in enumerate(zip(cut_idxs, cut_centers)):
-        
-        j = i % y_nr
-        k = i // y_nr
-        
-        difference = Ab.mc['reachability'][idx] - Ab.results['optimal_reward'][idx]
-        
-        if difference >= 0:
-            # Guarantees safe (model checking >= empirical)
-            cut_values[k,j] = 1
-        else:
-            # Guarantees unsafe (model checking < empirical)
-            cut_values[k,j] = 0
-        cut_coords[k,j,:] = center
+    # Guarantees safe (model checking >= empirical) if difference >= 0, and
+    # guarantees unsafe (model checking < empirical) otherwise
+    difference = np.asarray(Ab.mc['reachability'])[cut_idxs[found]] - \
+                 Ab.results['optimal_reward'][cut_idxs[found]]
+    
+    cut_values = np.zeros(len(cut_centers))
+    cut_values[found] = difference >= 0
+    
+    cut_values = cut_values.reshape(x_nr, y_nr)
     
-    plot_dataframe = pd.DataFrame( cut_values, index=cut_coords[:,0,0], 
-                           columns=cut_coords[0,:,1] )
+    # The centers are in row-major order, so the first column of every 
+    # y_nr-th row and the second column of the first y_nr rows give the axes
+    plot_dataframe = pd.DataFrame( cut_values, index=cut_centers[::y_nr, 0], 
+                           columns=cut_centers[:y_nr, 1] )
     
     # Compute the fraction of states for which the empirical reachability
     # guarantees (i.e. simulated performance) are lower than the guarantees
@@ -85,10 +82,9 @@ def oscillator_heatmap(Ab, title = 'auto'):
     # Save figure
     filename = Ab.setup.directories['outputFcase']+'safeset_N=' + \
                 str(Ab.args.noise_samples)
-    for form in Ab.setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, Ab.setup.plotting['exportFormats'])
         
-    plt.show()
+    show_figure(plt.gcf(), Ab.setup.plotting)
     
     return average_value
 
@@ -260,10 +256,9 @@ def oscillator_traces(Ab, traces, action_traces, plot_trace_ids=None,
     
     # Save figure
     filename = Ab.setup.directories['outputFcase']+'drone_trajectory'+str(case)
-    for form in Ab.setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, Ab.setup.plotting['exportFormats'])
         
-    plt.show()
+    show_figure(plt.gcf(), Ab.setup.plotting)
     
 
 
@@ -357,8 +352,8 @@ class oscillator_experiment(object):
         df = pd.DataFrame(columns=['guaranteed', 'simulated', 'ratio'], dtype=float)
         df.index.name = 'mass'
 
-        # eval_state = Ab.partition['R']['c_tuple'][(-9.5,0.5)]
-        eval_state = Ab.partition['R']['c_tuple'][state_center]
+        # eval_state = center_to_index((-9.5,0.5), Ab.spec.partition)[0]
+        eval_state = center_to_index(state_center, Ab.spec.partition)[0]
 
         f_list = np.arange(self.f_min, self.f_max+0.01, self.f_step)
 
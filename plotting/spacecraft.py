@@ -11,7 +11,7 @@ import os
 from pathlib import Path
 import matplotlib as mpl
 
-from core.commons import printWarning, cm2inch
+from core.commons import printWarning, cm2inch, savefig_formats, show_figure
 
 mpl.rcParams['figure.dpi'] = 300
 
@@ -135,10 +135,9 @@ def spacecraft(setup, trace):
     
     # Save figure
     filename = setup.directories['outputFcase']+'spacecraft_orbit'
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-    plt.show()
+    show_figure(plt.gcf(), setup.plotting)
 
 
 def Rx(theta):
@@ -7,7 +7,7 @@ from matplotlib import cm
 from matplotlib.patches import Rectangle
 import matplotlib.patches as patches
 
-from core.commons import printWarning, cm2inch
+from core.commons import printWarning, cm2inch, savefig_formats, show_figure
 
 def UAV_plot_2D(i_show, setup, args, regions, goal_regions, critical_regions, 
                 spec, traces, cut_idx, traces_to_plot = 10, line=False):
@@ -66,11 +66,10 @@ def UAV_plot_2D(i_show, setup, args, regions, goal_regions, critical_regions,
     
     ax.set_title("N = "+str(args.noise_samples),fontsize=10)
     
-    keys = list( regions['idx'].keys() )
     # Draw goal states
     for goal in goal_regions:
         
-        goalIdx   = np.array(keys[goal])
+        goalIdx   = np.array(np.unravel_index(goal, spec.partition['number']))
         if all(goalIdx[i_hide] == cut_idx):
 
             goal_lower = [regions['low'][goal][is1], regions['low'][goal][is2]]
@@ -79,11 +78,10 @@ def UAV_plot_2D(i_show, setup, args, regions, goal_regions, critical_regions,
                                   alpha=0.3, linewidth=None)
             ax.add_patch(goalState)
     
-    keys = list( regions['idx'].keys() )
     # Draw critical states
     for crit in critical_regions:
         
-        critIdx   = np.array(keys[crit])
+        critIdx   = np.array(np.unravel_index(crit, spec.partition['number']))
         
         if all(critIdx[i_hide] == cut_idx):
         
@@ -149,10 +147,9 @@ def UAV_plot_2D(i_show, setup, args, regions, goal_regions, critical_regions,
     
     # Save figure
     filename = setup.directories['outputFcase']+'drone_trajectory'
-    for form in setup.plotting['exportFormats']:
-        plt.savefig(filename+'.'+str(form), format=form, bbox_inches='tight')
+    savefig_formats(plt.gcf(), filename, setup.plotting['exportFormats'])
         
-    plt.show()
+    show_figure(plt.gcf(), setup.plotting)
 
 
 